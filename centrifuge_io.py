@@ -0,0 +1,334 @@
+import re
+import time
+import threading
+import collections
+import serial
+import numpy as np
+
+# Settings
+BUFFER_CAPACITY = 6000  # Samples kept for the plot window (60 s at up to 100 Hz)
+PLOT_POINTS = 800       # Points drawn per line, about one per horizontal pixel
+QUEUE_LENGTH = 2000     # Serial reads held for the GUI before the oldest are dropped
+MAX_RPM = 3000          # Top of the firmware's documented 0 - 3000 RPM range
+MAX_UNCONFIRMED_TIME = 600  # Longest run (s) a voice command may start without a yes/no
+BINARY_TELEMETRY = False  # Must match binaryTelemetry in the firmware
+
+# --- Serial Port ---
+def open_serial(port, baud_rate):
+    """
+    Opens the Arduino port in low-latency mode so the USB-serial driver hands
+    bytes over as they arrive instead of holding them for its batching timer.
+    Low-latency mode is Linux-only; other platforms just keep the default.
+    """
+    ser = serial.Serial(port, baud_rate, timeout=0.1)
+    try:
+        ser.set_low_latency_mode(True)
+    except Exception as e:
+        print(f"Low-latency serial mode unavailable: {e}")
+    return ser
+
+# --- Telemetry Parsing ---
+TELEMETRY_PATTERN = re.compile(
+    rb"RPM:\s*([-\d.]+)\s+MA:\s*([-\d.]+)\s+Set:\s*([-\d.]+)\s+PWM:\s*([-\d]+)\s+%Err:\s*([-\d.]+)"
+)
+
+TELEMETRY_LABELS = [b"RPM:", b"MA:", b"Set:", b"PWM:", b"%Err:"]
+
+def parse_samples(text):
+    """
+    Extracts every telemetry sample from a block of raw serial bytes; nothing
+    is decoded, since numpy and float() both accept the byte tokens directly.
+    Returns an (n, 5) float array with RPM, MA, Set, PWM and %Err columns.
+    """
+    # Fast path: the firmware prints a fixed "label value" layout, so when the
+    # block holds nothing but telemetry lines a plain split lines up the values
+    tokens = text.split()
+    n = len(tokens) // 10
+    if len(tokens) == n * 10 and tokens[0::2] == TELEMETRY_LABELS * n:
+        try:
+            return np.array(tokens[1::2], dtype=float).reshape(-1, 5)
+        except ValueError:
+            pass
+
+    # Status messages or garbled bytes in the block: fall back to the regex scan
+    matches = TELEMETRY_PATTERN.findall(text)
+    try:
+        return np.array(matches, dtype=float).reshape(-1, 5)
+    except ValueError:
+        # A garbled field (e.g. a lone "-") spoils the batch; keep the good rows
+        rows = []
+        for m in matches:
+            try:
+                rows.append([float(v) for v in m])
+            except ValueError:
+                continue
+        return np.array(rows, dtype=float).reshape(-1, 5)
+
+def parse_chunk(data, tail=b""):
+    """
+    Parses the complete lines in a block of raw serial bytes. Returns
+    (samples, tail); pass tail back in with the next block so a line split
+    across reads is not lost.
+    """
+    complete, _, tail = (tail + data).rpartition(b"\n")
+    return parse_samples(complete), tail
+
+# --- Binary Telemetry Frames ---
+# sync byte, RPM, MA, Set, PWM (int16), %Err, checksum (sum of the payload bytes)
+FRAME_SYNC = 0xAA
+FRAME_DTYPE = np.dtype([
+    ("sync", "u1"), ("rpm", "<f4"), ("ma", "<f4"), ("set", "<f4"),
+    ("pwm", "<i2"), ("perr", "<f4"), ("checksum", "u1"),
+])
+FRAME_SIZE = FRAME_DTYPE.itemsize  # 20 bytes, no padding
+FRAME_OFFSETS = np.arange(FRAME_SIZE)
+
+def parse_frames(data, tail=b""):
+    """
+    Parses the binary frames sent when the firmware has binaryTelemetry on.
+    Returns (samples, tail) like parse_chunk. Candidate sync bytes are found
+    and checksummed with numpy in one pass, and the accepted frames are
+    decoded through a structured dtype, so no per-field Python work is done.
+    A sync byte whose frame fails the checksum is skipped, so the parser
+    realigns after a dropped byte; text status messages are ASCII and never
+    contain the sync byte.
+    """
+    buf = np.frombuffer(tail + data, dtype=np.uint8)
+    syncs = np.flatnonzero(buf == FRAME_SYNC)
+    starts = syncs[syncs <= len(buf) - FRAME_SIZE]
+    frames = buf[starts[:, None] + FRAME_OFFSETS]
+    valid = frames[:, 1:-1].sum(axis=1, dtype=np.uint8) == frames[:, -1]
+
+    # A payload byte can look like a sync byte with a matching checksum, so
+    # keep valid frames greedily and drop any that overlap the one before
+    keep = np.flatnonzero(valid)
+    if np.any(np.diff(starts[keep]) < FRAME_SIZE):
+        kept = []
+        end = 0
+        for i in keep:
+            if starts[i] >= end:
+                kept.append(i)
+                end = starts[i] + FRAME_SIZE
+        keep = np.array(kept, dtype=np.intp)
+    end = starts[keep[-1]] + FRAME_SIZE if len(keep) else 0
+
+    # Whatever follows the last frame is kept if it may be the start of one
+    pending = syncs[(syncs >= end) & (syncs > len(buf) - FRAME_SIZE)]
+    tail = buf[pending[0]:].tobytes() if len(pending) else b""
+
+    records = frames[keep].view(FRAME_DTYPE).ravel()
+    samples = np.empty((len(records), 5))
+    for column, name in enumerate(("rpm", "ma", "set", "pwm", "perr")):
+        samples[:, column] = records[name]
+    return samples, tail
+
+# --- Serial Reader Thread ---
+class SerialReader(threading.Thread):
+    """
+    Reads the serial port on its own thread so acquisition does not wait on
+    the GUI: every block is timestamped with time.monotonic() as it arrives and
+    queued as (timestamp, samples) for the frame callback to drain.
+    """
+    def __init__(self, ser, binary=BINARY_TELEMETRY):
+        super().__init__(daemon=True)
+        self.ser = ser
+        self.binary = binary
+        self.queue = collections.deque(maxlen=QUEUE_LENGTH)
+        self.running = True
+
+    def run(self):
+        parse = parse_frames if self.binary else parse_chunk
+        tail = b""
+        while self.running:
+            try:
+                # Blocks for at most the port timeout when nothing is waiting
+                data = self.ser.read(max(1, self.ser.in_waiting))
+            except Exception as e:
+                if self.running:
+                    print(f"Error reading from serial: {e}")
+                break
+            if not data:
+                continue
+            stamp = time.monotonic()
+            samples, tail = parse(data, tail)
+            if len(samples):
+                self.queue.append((stamp, samples))
+
+    def drain(self):
+        """Returns every queued (timestamp, samples) block, oldest first."""
+        blocks = []
+        while self.queue:
+            blocks.append(self.queue.popleft())
+        return blocks
+
+    def stop(self):
+        """Stops the thread; call before closing the port."""
+        self.running = False
+        self.join()
+
+# --- Telemetry Ring Buffer ---
+class TelemetryBuffer:
+    """
+    Preallocated ring buffer for the rolling plot window, stored as one row per
+    channel: time, RPM, MA, Set, PWM, %Err. Every sample is written twice,
+    at i and i + capacity, so the live window is always one contiguous slice.
+    """
+    def __init__(self, capacity=BUFFER_CAPACITY):
+        self.capacity = capacity
+        self.data = np.zeros((6, 2 * capacity), dtype=np.float32)
+        self.head = 0   # index of the oldest sample
+        self.count = 0
+
+    def append(self, t, samples):
+        """Stores an (n, 5) block of samples, all stamped with time t."""
+        samples = samples[-self.capacity:]
+        n = len(samples)
+        idx = (self.head + self.count + np.arange(n)) % self.capacity
+        for offset in (0, self.capacity):
+            self.data[0, idx + offset] = t
+            self.data[1:, idx + offset] = samples.T
+        overflow = max(0, self.count + n - self.capacity)
+        self.head = (self.head + overflow) % self.capacity
+        self.count = min(self.count + n, self.capacity)
+
+    def trim(self, t_min):
+        """Drops samples older than t_min by advancing the head; no data moves."""
+        old = int(np.searchsorted(self.view()[0], t_min))
+        self.head = (self.head + old) % self.capacity
+        self.count -= old
+
+    def view(self):
+        """Returns a (6, count) view of the window, oldest sample first."""
+        return self.data[:, self.head:self.head + self.count]
+
+# --- Plot Downsampling ---
+def downsample(x, y, n=PLOT_POINTS):
+    """
+    Reduces a trace to about n points before it is handed to matplotlib, which
+    would otherwise transform every sample even though the axes are only a few
+    hundred pixels wide. The window is split into n / 2 equal buckets and each
+    keeps its lowest and highest sample, so spikes still show up on screen.
+    """
+    if len(x) <= n:
+        return x, y
+    buckets = n // 2
+    size = len(x) // buckets
+    start = len(x) - size * buckets  # the few leftover oldest samples are skipped
+    blocks = y[start:].reshape(buckets, size)
+    base = start + np.arange(buckets) * size
+    idx = np.sort(np.concatenate((base + blocks.argmin(axis=1), base + blocks.argmax(axis=1))))
+    return x[idx], y[idx]
+
+# --- Axis Limits ---
+def autoscale_y(ax, rows, margin=0.05):
+    """
+    Fits ax's y-limits to the given data rows with numpy min/max instead of
+    relim()/autoscale_view(), which walk every line's path. The limits are
+    only changed when an edge moves by more than the margin, so small
+    fluctuations do not trigger a relayout.
+    """
+    if not len(rows[0]):
+        return
+    low = min(float(r.min()) for r in rows)
+    high = max(float(r.max()) for r in rows)
+    pad = (high - low) * margin if high > low else max(abs(high) * margin, 1.0)
+    low, high = low - pad, high + pad
+    cur_low, cur_high = ax.get_ylim()
+    tolerance = (high - low) * margin
+    if abs(cur_low - low) > tolerance or abs(cur_high - high) > tolerance:
+        ax.set_ylim(low, high)
+
+# --- Command Parsing ---
+RPM_PATTERN = re.compile(r"(\d+)\s*rpm", re.IGNORECASE)
+TIME_PATTERN = re.compile(r"(\d+)\s*(minutes?|seconds?)", re.IGNORECASE)
+ANSWER_PATTERN = re.compile(r"^\s*\d+[,\s]+\d+\s")
+PLAIN_ANSWER_PATTERN = re.compile(r"\d+[,\s]+\d+")
+NUMBER_PATTERN = re.compile(r"\d+(?:\.\d+)?")
+THOUSANDS_PATTERN = re.compile(r"(?<=\d),(?=\d{3}\b)")
+YES_PATTERN = re.compile(r"\b(yes|yeah|yep|yup|sure)\b", re.IGNORECASE)
+NO_PATTERN = re.compile(r"\b(no|not|nope|don't)\b", re.IGNORECASE)
+CORRECTION_PATTERN = re.compile(
+    r"\b(actually|instead|wait|sorry|rather|cancel|stop|abort|never ?mind|i mean)\b", re.IGNORECASE
+)
+SPOKEN_TIME_PATTERN = re.compile(r"\b(seconds?|secs?|minutes?|mins?)\b", re.IGNORECASE)
+
+def parse_command(command):
+    """
+    Extracts (rpm, seconds) from "<RPM> <TIME>", "<RPM>,<TIME>" or a natural
+    language request mentioning "rpm" and a time unit. Missing values are None.
+    """
+    command = command.strip()
+    # Fast path for the usual "<RPM> <TIME>" / "<RPM>,<TIME>" answer
+    parts = command.replace(",", " ").split()
+    if len(parts) == 2 and parts[0].isdecimal() and parts[1].isdecimal():
+        return int(parts[0]), int(parts[1])
+
+    rpm_match = RPM_PATTERN.search(command)
+    time_match = TIME_PATTERN.search(command)
+
+    if rpm_match:
+        rpm_val = int(rpm_match.group(1))
+    else:
+        try:
+            rpm_val = int(float(command))
+        except ValueError:
+            rpm_val = None
+
+    timer = None
+    if time_match:
+        timer = int(time_match.group(1))
+        if 'min' in time_match.group(2).lower():
+            timer *= 60
+    return rpm_val, timer
+
+def answer_complete(text):
+    """True once a streamed model answer holds a full "<RPM> <TIME>" pair."""
+    return ANSWER_PATTERN.match(text) is not None
+
+def answer_is_plain(text):
+    """True when a model answer is exactly "<RPM> <TIME>" with nothing else around it."""
+    return PLAIN_ANSWER_PATTERN.fullmatch(text.strip()) is not None
+
+def parse_spoken_command(text):
+    """
+    Parses a transcript such as "set 2000 rpm for 15 seconds" without the
+    model. Returns (rpm, seconds) only when the request is unambiguous:
+    exactly two whole numbers, one followed by "rpm" and one by a time unit.
+    Anything else returns (None, None) and is left to the model.
+    """
+    text = THOUSANDS_PATTERN.sub("", text)  # Whisper writes "2,000 rpm"
+    numbers = NUMBER_PATTERN.findall(text)
+    if len(numbers) != 2 or not all(n.isdecimal() for n in numbers):
+        return None, None
+    if not (RPM_PATTERN.search(text) and TIME_PATTERN.search(text)):
+        return None, None
+    return parse_command(text)
+
+def skips_confirmation(transcript, answer):
+    """
+    True when a voice command may be sent without asking yes/no first. The
+    answer must be a plain "<RPM> <TIME>" with the RPM in 0 - MAX_RPM and the
+    time in 1 - MAX_UNCONFIRMED_TIME seconds; the transcript must name a time
+    unit, match any "<N> rpm" it states, and hold no negation or correction
+    ("don't", "actually", "I mean"). Anything else goes to the confirmation.
+    """
+    if not answer_is_plain(answer):
+        return False
+    if NO_PATTERN.search(transcript) or CORRECTION_PATTERN.search(transcript):
+        return False
+    transcript = THOUSANDS_PATTERN.sub("", transcript)
+    if not SPOKEN_TIME_PATTERN.search(transcript):
+        return False
+    rpm, timer = parse_command(answer)
+    spoken_rpm = RPM_PATTERN.search(transcript)
+    if spoken_rpm and int(spoken_rpm.group(1)) != rpm:
+        return False
+    return 0 <= rpm <= MAX_RPM and 0 < timer <= MAX_UNCONFIRMED_TIME
+
+def is_affirmative(text):
+    """
+    True when a spoken yes/no answer means yes ("yes", "yeah", "yep", "sure")
+    and holds no "no" or "not", so "not sure" is still read as a no. Matched
+    on the transcript directly; a yes/no never needs the model.
+    """
+    return YES_PATTERN.search(text) is not None and NO_PATTERN.search(text) is None
@@ -2,7 +2,7 @@
 *  Group: P4
 *  Group Members: Jeff Liu, Lucas Sosnick, Zach Lin
 *  Author: Jeff Liu
-*  Version: 1.7
+*  Version: 1.8
 *  PID-Controlled DC Motor RPM w/ Hall Effect Sensor
 *
 *  Reads pulses from a Hall-effect sensor to measure
@@ -12,6 +12,8 @@
 *  Note: user can input RPM via serial monitor or python terminal (range: 0 - 3000;
 *  dependent on if using interface)
 *  When desired RPM set to 0, the motor stopped and PID vals are reset
+*  Set binaryTelemetry to true to send packed 20-byte frames instead of
+*  text lines (BINARY_TELEMETRY in centrifuge_io.py must match)
 ***************************************************************/
 
 const int hallPin = 2;   
@@ -27,9 +29,29 @@ const int bufferSize = 5;
 float rpmBuffer[bufferSize] = {0};
 int bufferIndex = 0;
 int sampleCount = 0;
+// telemetry format: false = text lines, true = binary frames
+const bool binaryTelemetry = false;
 void countPulse() {
   pulseCount++;
 }
+// frame: 0xAA, RPM, MA, Set (float), PWM (int16), %Err (float), checksum
+// checksum = sum of the 18 payload bytes (mod 256); floats are little-endian
+void sendTelemetryFrame(float rpm, float ma, float setRPM, int pwm, float pctErr) {
+  uint8_t frame[20];
+  int16_t pwm16 = pwm;
+  frame[0] = 0xAA;
+  memcpy(frame + 1, &rpm, 4);
+  memcpy(frame + 5, &ma, 4);
+  memcpy(frame + 9, &setRPM, 4);
+  memcpy(frame + 13, &pwm16, 2);
+  memcpy(frame + 15, &pctErr, 4);
+  uint8_t sum = 0;
+  for (int i = 1; i < 19; i++) {
+    sum += frame[i];
+  }
+  frame[19] = sum;
+  Serial.write(frame, sizeof(frame));
+}
 void setup() {
   pinMode(hallPin, INPUT_PULLUP);
   pinMode(pwmPin, OUTPUT);
@@ -77,16 +99,20 @@ void loop() {
       percentageError = (fabs(error) / desiredRPM) * 100.0;
     }
     // output values
-    Serial.print("RPM: ");
-    Serial.print(currentRPM, 2);
-    Serial.print("   MA: ");
-    Serial.print(movingAverageRPM, 2);
-    Serial.print("   Set: ");
-    Serial.print(desiredRPM, 2);
-    Serial.print("   PWM: ");
-    Serial.print(pwmOutput);
-    Serial.print("   %Err: ");
-    Serial.println(percentageError, 2);
+    if (binaryTelemetry) {
+      sendTelemetryFrame(currentRPM, movingAverageRPM, desiredRPM, pwmOutput, percentageError);
+    } else {
+      Serial.print("RPM: ");
+      Serial.print(currentRPM, 2);
+      Serial.print("   MA: ");
+      Serial.print(movingAverageRPM, 2);
+      Serial.print("   Set: ");
+      Serial.print(desiredRPM, 2);
+      Serial.print("   PWM: ");
+      Serial.print(pwmOutput);
+      Serial.print("   %Err: ");
+      Serial.println(percentageError, 2);
+    }
   }
   // check for new input
   if (Serial.available() > 0) {
@@ -1,48 +1,66 @@
 #!/usr/bin/env python3
 import sys
-import serial
 import time
-import re
+import collections
 import numpy as np
 import matplotlib.pyplot as plt
-from matplotlib.animation import FuncAnimation
 from matplotlib.widgets import TextBox, Button
+from matplotlib.transforms import Bbox
 import voice_to_text as v2t
-import subprocess
-import asyncio
-import edge_tts
-import os
+from centrifuge_io import (
+    TelemetryBuffer, SerialReader, open_serial, downsample, autoscale_y,
+    parse_command, parse_spoken_command, answer_complete, skips_confirmation, is_affirmative
+)
+import llm
+from text_to_speech import speak, prefetch
 import threading
 
-# --- TTS Helper ---
-async def speak_text(text):
-    communicate = edge_tts.Communicate(text, voice="en-US-GuyNeural")
-    output_file = "tts_output.mp3"
-    await communicate.save(output_file)
-    subprocess.run(["afplay", output_file])  # For macOS; adjust if needed
-    os.remove(output_file)
-
 # --- Configuration ---
 SERIAL_PORT = "/dev/cu.usbmodem1101"  # adjust to your board
 BAUD_RATE = 9600
+RESCALE_INTERVAL = 1.0  # seconds between full redraws (axes limits, countdown)
+WINDOW_SECONDS = 60     # rolling plot window
+CANCEL_WINDOW = 3       # seconds to say "cancel" after an unconfirmed voice command
+
+# Chat button background: the rainbow colormap baked to RGBA bytes once, so
+# imshow draws the raw array instead of running the colormap on every redraw
+CHAT_GRADIENT = (plt.get_cmap("rainbow")(np.linspace(0, 1, 256)) * 255).astype(np.uint8).reshape(1, 256, 4)
+
+# Fixed voice replies, synthesized and decoded ahead of time
+CONFIRM_QUESTION = "Is this correct? Please say yes or no."
+CONFIRMED_REPLY = "Command confirmed. Sending command."
+ABORTED_REPLY = "Command aborted."
+CANCELLED_REPLY = "Command cancelled. Stopping the motor."
+CHAT_GREETING = "Chat mode activated. What would you like to talk about?"
+CHAT_EXIT_REPLY = "Exiting chat mode."
+NEW_SESSION_QUESTION = "Do you want to start a new session? Please say yes or no."
+GOODBYE = "Exiting the program. Goodbye."
+FIXED_REPLIES = [
+    CONFIRM_QUESTION, CONFIRMED_REPLY, ABORTED_REPLY, CANCELLED_REPLY,
+    CHAT_GREETING, CHAT_EXIT_REPLY, NEW_SESSION_QUESTION, GOODBYE,
+]
+
+# Fixed start of every model command prompt; it never changes, so Ollama can
+# reuse its cached prefix and only process the spoken request after it
+COMMAND_PROMPT = (
+    "Extract the centrifuge settings from the following request exactly as stated. "
+    "Return the answer in '<RPM> <TIME>' format.\n\nRequest: "
+)
 
 # --- Globals ---
 countdown_end_time = None
-t_data = []
-rpm_data = []
-ma_data = []
-set_data = []
-pwm_data = []
-perr_data = []
+telemetry = None
 start_time = None
+voice_label = None  # new voice button label, applied by the GUI timer
 
 # --- Sliding Window Log ---
-terminal_log = []
-log_text_object = None
 MAX_VISIBLE_LINES = 20  # Only show the last 20 lines
+terminal_log = collections.deque(maxlen=MAX_VISIBLE_LINES)
+log_text_object = None
+log_dirty = False
 
 class EmittingStream:
-    """ Redirect 'print' statements to a list, then refresh the figure text. """
+    """ Redirect 'print' statements to the log; the GUI timer refreshes the figure text. """
     def __init__(self, text_update_callback):
         self.text_update_callback = text_update_callback
 
@@ -56,57 +74,38 @@ class EmittingStream:
     def flush(self):
         pass
 
+def mark_log_dirty():
+    global log_dirty
+    log_dirty = True
+
 def update_log_text():
     """
     Display only the last MAX_VISIBLE_LINES lines, so new lines appear at bottom.
-    The oldest lines scroll off the top.
+    The oldest lines scroll off the top. Runs on the GUI timer and only updates
+    the text when something was printed since the last tick, so a burst of
+    prints (from any thread) costs at most one repaint. Returns True when the
+    text changed and the log needs repainting.
     """
-    # Keep a slice of the last N lines
-    latest_lines = terminal_log[-MAX_VISIBLE_LINES:]
-    # This is normal, oldest line first ... newest line last 
+    global log_dirty
+    if not log_dirty or log_text_object is None:
+        return False
+    log_dirty = False
+    # Oldest line first ... newest line last
     # => new lines are visually at the bottom (because of va='top')
-    log_text = "\n".join(latest_lines)
-    if log_text_object is not None:
-        log_text_object.set_text(log_text)
-    plt.draw()
+    log_text_object.set_text("\n".join(terminal_log))
+    return True
 
 # Redirect stdout to use our custom logger
-sys.stdout = EmittingStream(update_log_text)
+sys.stdout = EmittingStream(mark_log_dirty)
 
 # --- Helper Functions ---
-def parse_command(command):
-    command = command.strip()
-    two_numbers = re.match(r"^(\d+)[,\s]+(\d+)$", command)
-    if two_numbers:
-        rpm_val = int(two_numbers.group(1))
-        timer = int(two_numbers.group(2))
-        return rpm_val, timer
-
-    rpm_match = re.search(r"(\d+)\s*rpm", command, re.IGNORECASE)
-    time_match = re.search(r"(\d+)\s*(minutes?|seconds?)", command, re.IGNORECASE)
-    
-    if rpm_match:
-        rpm_val = int(rpm_match.group(1))
-    else:
-        try:
-            rpm_val = int(float(command))
-        except ValueError:
-            rpm_val = None
-
-    timer = None
-    if time_match:
-        timer = int(time_match.group(1))
-        if 'min' in time_match.group(2).lower():
-            timer *= 60
-    return rpm_val, timer
-
 def send_command(command, ser):
     global countdown_end_time
     rpm, timer = parse_command(command)
     if rpm is not None:
         if timer is not None:
             data = f"{rpm},{timer}\n"
-            countdown_end_time = time.time() + timer
+            countdown_end_time = time.monotonic() + timer
         else:
             data = f"{rpm}\n"
             countdown_end_time = None
@@ -129,7 +128,7 @@ def manual_submit(event):
         timer_val = int(time_text) if time_text else None
         if timer_val is not None:
             cmd = f"{rpm_val},{timer_val}\n"
-            countdown_end_time = time.time() + timer_val
+            countdown_end_time = time.monotonic() + timer_val
         else:
             cmd = f"{rpm_val}\n"
             countdown_end_time = None
@@ -142,37 +141,62 @@ def manual_submit(event):
     except Exception as e:
         print(f"Error in manual submission: {e}")
 
+def send_with_cancel_window(command, command_text):
+    """
+    Sends a clearly parsed voice command straight away instead of asking for a
+    yes/no first, then listens briefly so the user can still say "cancel".
+    A cancelled command's cached answer for command_text is dropped.
+    """
+    send_command(command, ser)
+    rpm, timer = parse_command(command)
+    # Different for every command, so it isn't kept in the speech cache
+    speak(f"Sending {rpm} RPM for {timer} seconds. Say cancel to abort.", cache=False)
+
+    original_duration = v2t.DURATION
+    v2t.DURATION = CANCEL_WINDOW
+    response = v2t.recognize_speech()
+    v2t.DURATION = original_duration
+    if "cancel" in response.lower() or "abort" in response.lower():
+        print("User cancelled. Stopping the motor.")
+        send_command("0", ser)
+        speak(CANCELLED_REPLY, wait=False)
+        llm.forget(COMMAND_PROMPT, command_text, options=llm.COMMAND_OPTIONS)
+
 def voice_input_async():
-    voice_button.label.set_text("Listening...")
-    plt.draw()
+    global voice_label
+    voice_label = "Listening..."
     
     print("Listening for voice command...")
     command_text = v2t.listen_for_trigger()
     if command_text:
         print("Voice command recognized:", command_text)
-        base_prompt = (
-            "Extract the centrifuge settings from the following request exactly as stated. "
-            "Return the answer in '<RPM> <TIME>' format.\n\nRequest: "
-        )
-        combined_prompt = base_prompt + command_text
-        print("Generated Prompt:", combined_prompt)
-
-        try:
-            result = subprocess.run(
-                ['ollama', 'run', 'phi4', combined_prompt],
-                capture_output=True,
-                text=True
-            )
-            output = result.stdout.strip()
-            print("Raw output from phi4:", output)
-        except Exception as e:
-            print(f"Error running phi4: {e}")
-            output = ""
+        rpm, timer = parse_spoken_command(command_text)
+        if rpm is not None:
+            # Plain "<N> rpm for <N> seconds" requests don't need the model
+            output = f"{rpm} {timer}"
+            print("Parsed directly from speech:", output)
+        else:
+            combined_prompt = COMMAND_PROMPT + command_text
+            print("Generated Prompt:", combined_prompt)
+            prefetch([CONFIRM_QUESTION, CONFIRMED_REPLY, ABORTED_REPLY])
 
-        if output:
-            confirmation = f"The parsed command is: {output}. Is this correct? Please say yes or no."
-            asyncio.run(speak_text(confirmation))
-            print(confirmation)
+            try:
+                output = llm.cached_generate(
+                    COMMAND_PROMPT, command_text, stop_when=answer_complete, options=llm.COMMAND_OPTIONS
+                )
+                print(f"Raw output from {llm.COMMAND_MODEL}:", output)
+            except Exception as e:
+                print(f"Error running {llm.COMMAND_MODEL}: {e}")
+                output = ""
+
+        if output and skips_confirmation(command_text, output):
+            send_with_cancel_window(output, command_text)
+        elif output:
+            # Only the parsed part is new speech; the question is already cached
+            confirmation = f"The parsed command is: {output}."
+            print(confirmation, CONFIRM_QUESTION)
+            speak(confirmation, cache=False)
+            speak(CONFIRM_QUESTION)
 
             original_duration = v2t.DURATION
             v2t.DURATION = 5
@@ -180,37 +204,27 @@ def voice_input_async():
             v2t.DURATION = original_duration
             print("User response:", response)
 
-            if "yes" in response.lower():
+            if is_affirmative(response):
                 print("User confirmed. Sending command.")
-                asyncio.run(speak_text("Command confirmed. Sending command."))
+                speak(CONFIRMED_REPLY, wait=False)  # Plays while the command goes out
                 send_command(output, ser)
             else:
                 print("User did not confirm. Command aborted.")
-                asyncio.run(speak_text("Command aborted."))
+                speak(ABORTED_REPLY, wait=False)
+                llm.forget(COMMAND_PROMPT, command_text, options=llm.COMMAND_OPTIONS)
         else:
-            print("No valid output received from phi4.")
+            print(f"No valid output received from {llm.COMMAND_MODEL}.")
     else:
         print("No voice command detected.")
 
-    voice_button.label.set_text("Voice Input")
-    plt.draw()
+    voice_label = "Voice Input"
 
 def voice_input(event):
     threading.Thread(target=voice_input_async, daemon=True).start()
 
 def call_chatbot_api(conversation_history):
-    prompt = ""
-    for msg in conversation_history:
-        prompt += f"{msg['role']}: {msg['content']}\n"
-    prompt += "assistant: "
-
     try:
-        result = subprocess.run(
-            ['ollama', 'run', 'phi4', prompt],
-            capture_output=True,
-            text=True
-        )
-        response = result.stdout.strip()
+        response = llm.chat(conversation_history)
     except Exception as e:
         print(f"Error calling chatbot API: {e}")
         response = "Sorry, I'm having trouble responding."
@@ -220,53 +234,46 @@ def chat_mode():
     conversation_history = [
         {"role": "system", "content": "You are a fun, witty, and engaging scientific chat partner. Be brief."}
     ]
-    asyncio.run(speak_text("Chat mode activated. What would you like to talk about?"))
+    speak(CHAT_GREETING)
 
     while True:
         user_input = v2t.recognize_speech()
         if not user_input:
             continue
         if "exit chat" in user_input.lower() or "quit chat" in user_input.lower():
-            asyncio.run(speak_text("Exiting chat mode."))
+            speak(CHAT_EXIT_REPLY, wait=False)
             break
 
         conversation_history.append({"role": "user", "content": user_input})
         response = call_chatbot_api(conversation_history)
         conversation_history.append({"role": "assistant", "content": response})
-        asyncio.run(speak_text(response))
+        speak(response, cache=False)
 
 def run_session():
     global ser, countdown_end_time
-    global t_data, rpm_data, ma_data, set_data, pwm_data, perr_data, start_time
+    global telemetry, start_time
     global log_text_object
 
     countdown_end_time = None
-    t_data = []
-    rpm_data = []
-    ma_data = []
-    set_data = []
-    pwm_data = []
-    perr_data = []
-    start_time = time.time()
+    telemetry = TelemetryBuffer()
+    start_time = time.monotonic()
 
     try:
-        ser = serial.Serial(SERIAL_PORT, BAUD_RATE, timeout=0.1)
+        ser = open_serial(SERIAL_PORT, BAUD_RATE)
     except Exception as e:
         print(f"Error opening serial port: {e}")
         return
 
     time.sleep(2)
-
-    pattern = re.compile(
-        r"RPM:\s*([-\d.]+)\s+MA:\s*([-\d.]+)\s+Set:\s*([-\d.]+)\s+PWM:\s*([-\d]+)\s+%Err:\s*([-\d.]+)"
-    )
+    reader = SerialReader(ser)
+    reader.start()
 
     # Create a figure with 4 rows for 3 plots + 1 log axis
     fig = plt.figure(figsize=(10, 10))
     gs = fig.add_gridspec(nrows=4, ncols=1, height_ratios=[1, 1, 1, 1])
     ax1 = fig.add_subplot(gs[0, 0])
-    ax2 = fig.add_subplot(gs[1, 0])
-    ax3 = fig.add_subplot(gs[2, 0])
+    ax2 = fig.add_subplot(gs[1, 0], sharex=ax1)
+    ax3 = fig.add_subplot(gs[2, 0], sharex=ax1)
     ax_log = fig.add_subplot(gs[3, 0])
 
     # Extra bottom margin for text boxes & buttons
@@ -298,6 +305,11 @@ def run_session():
     ax3.legend(loc="upper right")
     ax3.grid(True)
 
+    # Lines are blitted each frame; everything else is only drawn on full redraws
+    lines = (line_rpm, line_ma, line_set, line_pwm, line_perr)
+    for line in lines:
+        line.set_animated(True)
+
     # -- Terminal Log Axis --
     ax_log.axis("off")
     # Pin the text to the top-left corner. New lines accumulate downward.
@@ -308,75 +320,113 @@ def run_session():
         fontsize=9,
         family="monospace",
         clip_on=True,
-        transform=ax_log.transAxes
+        transform=ax_log.transAxes,
+        animated=True
     )
 
-    def update(frame):
-        global countdown_end_time
-        while ser.in_waiting:
+    # The background under all three plots (grid, ticks, legends) is cached
+    # once after every full draw; frames restore it in one go and repaint
+    # only the lines. The log panel gets its own (empty) background so new
+    # log lines repaint just that panel.
+    plot_bbox = None
+    background = None
+    log_background = None
+
+    def draw_lines():
+        for line in lines:
+            line.axes.draw_artist(line)
+
+    def on_draw(event):
+        nonlocal plot_bbox, background, log_background
+        # Recomputed on every draw so the region follows window resizes
+        plot_bbox = Bbox.union([ax.bbox for ax in (ax1, ax2, ax3)])
+        background = fig.canvas.copy_from_bbox(plot_bbox)
+        log_background = fig.canvas.copy_from_bbox(ax_log.bbox)
+        draw_lines()
+        ax_log.draw_artist(log_text_object)
+
+    fig.canvas.mpl_connect("draw_event", on_draw)
+
+    last_rescale = float("-inf")
+    rescale_data = False  # samples arrived since the y-limits were last fitted
+
+    def update():
+        global countdown_end_time, voice_label
+        nonlocal last_rescale, rescale_data
+        # The voice thread only leaves the label here; it is drawn on this
+        # thread by repainting just the button
+        if voice_label is not None:
+            voice_button.label.set_text(voice_label)
+            voice_label = None
+            voice_button.ax.draw_artist(voice_button.ax.patch)
+            voice_button.ax.draw_artist(voice_button.label)
+            fig.canvas.blit(voice_button.ax.bbox)
+
+        if update_log_text() and log_background is not None:
+            fig.canvas.restore_region(log_background)
+            ax_log.draw_artist(log_text_object)
+            fig.canvas.blit(ax_log.bbox)
+
+        if countdown_end_time is not None and countdown_end_time - time.monotonic() <= 0:
             try:
-                line = ser.readline().decode("utf-8", errors="ignore").strip()
+                ser.write("0\n".encode())
+                ser.flush()
             except Exception as e:
-                print(f"Error reading line from serial: {e}")
-                continue
-            if line:
-                m = pattern.search(line)
-                if m:
-                    try:
-                        rpm_val  = float(m.group(1))
-                        ma_val   = float(m.group(2))
-                        set_val  = float(m.group(3))
-                        pwm_val  = int(m.group(4))
-                        perr_val = float(m.group(5))
-                    except ValueError:
-                        continue
-                    current_time = time.time() - start_time
-                    t_data.append(current_time)
-                    rpm_data.append(rpm_val)
-                    ma_data.append(ma_val)
-                    set_data.append(set_val)
-                    pwm_data.append(pwm_val)
-                    perr_data.append(perr_val)
-
-        current_time = time.time() - start_time
-        # Keep only 60s of rolling data
-        while t_data and t_data[0] < current_time - 60:
-            t_data.pop(0)
-            rpm_data.pop(0)
-            ma_data.pop(0)
-            set_data.pop(0)
-            pwm_data.pop(0)
-            perr_data.pop(0)
-
-        line_rpm.set_data(t_data, rpm_data)
-        line_ma.set_data(t_data, ma_data)
-        line_set.set_data(t_data, set_data)
-        line_pwm.set_data(t_data, pwm_data)
-        line_perr.set_data(t_data, perr_data)
-
-        for ax in (ax1, ax2, ax3):
-            ax.set_xlim(max(0, current_time - 60), current_time + 1)
-            ax.relim()
-            ax.autoscale_view(scalex=False)
-
-        if countdown_end_time is not None:
-            remaining = countdown_end_time - time.time()
-            if remaining <= 0:
-                countdown_text.set_text("")
-                try:
-                    ser.write("0\n".encode())
-                    ser.flush()
-                except Exception as e:
-                    print(f"Error sending stop command: {e}")
-                countdown_end_time = None
-            else:
+                print(f"Error sending stop command: {e}")
+            countdown_end_time = None
+
+        blocks = reader.drain()
+        for stamp, samples in blocks:
+            telemetry.append(stamp - start_time, samples)
+        rescale_data = rescale_data or bool(blocks)
+
+        current_time = time.monotonic() - start_time
+        rescale_due = current_time - last_rescale >= RESCALE_INTERVAL
+        # The lines only change when samples arrive, so idle ticks between
+        # rescales (e.g. while the board is quiet) skip all plotting work
+        if not (blocks or rescale_due):
+            return
+
+        # Keep only the rolling window
+        telemetry.trim(current_time - WINDOW_SECONDS)
+
+        t, rpm, ma, set_rpm, pwm, perr = telemetry.view()
+        line_rpm.set_data(*downsample(t, rpm))
+        line_ma.set_data(*downsample(t, ma))
+        line_set.set_data(*downsample(t, set_rpm))
+        line_pwm.set_data(*downsample(t, pwm))
+        line_perr.set_data(*downsample(t, perr))
+
+        # Blitting only repaints the lines, so axis limits and the countdown
+        # are refreshed with a full redraw once per RESCALE_INTERVAL, which
+        # also re-caches the background through on_draw.
+        if rescale_due:
+            last_rescale = current_time
+            # ax2 and ax3 share ax1's x-axis
+            ax1.set_xlim(max(0, current_time - WINDOW_SECONDS), current_time + 1)
+            # The y-limits can only move when new samples came in
+            if rescale_data:
+                rescale_data = False
+                for ax, rows in ((ax1, (rpm, ma, set_rpm)), (ax2, (pwm,)), (ax3, (perr,))):
+                    autoscale_y(ax, rows)
+
+            if countdown_end_time is not None:
+                remaining = countdown_end_time - time.monotonic()
                 countdown_text.set_text(f"Remaining Time: {int(remaining)} s")
-        else:
-            countdown_text.set_text("")
+            else:
+                countdown_text.set_text("")
+            fig.canvas.draw()
+            return
 
-        return (line_rpm, line_ma, line_set, line_pwm, line_perr)
+        if background is None:
+            return
+        fig.canvas.restore_region(background)
+        draw_lines()
+        fig.canvas.blit(plot_bbox)
 
-    ani = FuncAnimation(fig, update, interval=100)
+    timer = fig.canvas.new_timer(interval=100)
+    timer.add_callback(update)
+    timer.start()
 
     # ------------- Place text boxes and buttons -------------
     ax_rpm = fig.add_axes([0.1, 0.16, 0.25, 0.05])
@@ -397,27 +447,30 @@ def run_session():
     voice_button.on_clicked(voice_input)
 
     ax_chat = fig.add_axes([0.1, 0.08, 0.15, 0.05])
-    n = 256
-    gradient = np.linspace(0, 1, n).reshape(1, n)
-    ax_chat.imshow(gradient, aspect='auto', cmap='rainbow',
-                   origin='lower', extent=[0, 1, 0, 1])
+    ax_chat.imshow(CHAT_GRADIENT, aspect='auto', origin='lower', extent=[0, 1, 0, 1])
     ax_chat.patch.set_alpha(0)
     chat_button = Button(ax_chat, "Chat Mode", color='none', hovercolor='none')
     chat_button.label.set_fontsize(12)
     chat_button.on_clicked(lambda event: threading.Thread(target=chat_mode, daemon=True).start())
 
     plt.show()
+    timer.stop()
+    reader.stop()
     ser.close()
 
 if __name__ == '__main__':
+    # Have every fixed reply ready, and the command and Whisper models loaded, before they are first needed
+    prefetch(FIXED_REPLIES)
+    threading.Thread(target=llm.warm_up, args=(COMMAND_PROMPT,), daemon=True).start()
+    threading.Thread(target=v2t.warm_up, daemon=True).start()
     while True:
         run_session()
-        asyncio.run(speak_text("Do you want to start a new session? Please say yes or no."))
+        speak(NEW_SESSION_QUESTION)
         print("Awaiting response for new session...")
         response = v2t.recognize_speech()
         print("Response received:", response)
-        if "yes" in response.lower():
+        if is_affirmative(response):
             continue
         else:
-            asyncio.run(speak_text("Exiting the program. Goodbye."))
+            speak(GOODBYE)
             break
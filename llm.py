@@ -0,0 +1,165 @@
+import os
+import json
+import string
+import time
+import shelve
+import hashlib
+import threading
+import requests
+
+# Settings
+MODEL = "phi4"  # Chat mode
+# Command extraction only pulls two numbers out of a short sentence, which a
+# small model handles at a fraction of phi4's decode time and memory; the
+# default llama3.2:3b tag is quantized to Q4_K_M
+COMMAND_MODEL = "llama3.2:3b"
+OLLAMA_URL = "http://localhost:11434"
+KEEP_ALIVE = "30m"  # How long Ollama keeps the model loaded after a call
+CACHE_FILE = os.path.expanduser("~/.cache/centrifuge_llm")
+CACHE_TTL = 30 * 24 * 3600  # Seconds before a cached answer is asked again
+CACHE_SIZE = 256  # Most answers kept; the oldest are dropped beyond this
+CACHE_TRIM_TO = CACHE_SIZE * 3 // 4  # Answers left after the oldest are dropped
+# Command parsing only needs "<RPM> <TIME>": a few tokens on one line, decoded greedily
+COMMAND_OPTIONS = {"num_predict": 10, "temperature": 0, "stop": ["\n"]}
+
+# One HTTP session to the Ollama server, reused by every call
+session = requests.Session()
+session_lock = threading.Lock()
+
+def generate(prompt, stop_when=None, options=None):
+    """
+    Runs a single prompt through the local command model and returns its answer.
+    Talks to the running Ollama server instead of spawning `ollama run`, and
+    keep_alive keeps the model loaded so only the first call pays for loading it.
+
+    With stop_when, the answer is streamed and dropped as soon as
+    stop_when(text_so_far) is true, so the caller can move on without waiting
+    for whatever the model adds after the part it needs. options are passed
+    through as Ollama model options, e.g. COMMAND_OPTIONS to cap the answer
+    length so a rambling answer cannot run on.
+    """
+    stream = stop_when is not None
+    payload = {"model": COMMAND_MODEL, "prompt": prompt, "stream": stream, "keep_alive": KEEP_ALIVE}
+    if options:
+        payload["options"] = options
+    with session_lock:
+        response = session.post(
+            f"{OLLAMA_URL}/api/generate",
+            json=payload,
+            stream=stream,
+            timeout=120
+        )
+        response.raise_for_status()
+        if not stream:
+            return response.json()["response"].strip()
+
+        text = ""
+        with response:
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                text += chunk.get("response", "")
+                if chunk.get("done") or stop_when(text):
+                    break
+        return text.strip()
+
+def warm_up(prompt=""):
+    """
+    Loads the command model into the Ollama server ahead of the first request, so the
+    first voice command does not also pay for reading the weights. A request
+    with no prompt only loads the model; keep_alive then keeps it resident.
+
+    Given a prompt prefix (the fixed part of every command prompt), it is also
+    run once for a single token: Ollama keeps the prefix in its KV cache, so
+    later prompts starting with it only process the new text after it.
+    """
+    payload = {"model": COMMAND_MODEL, "keep_alive": KEEP_ALIVE}
+    if prompt:
+        payload.update(prompt=prompt, stream=False, options={**COMMAND_OPTIONS, "num_predict": 1})
+    try:
+        with session_lock:
+            response = session.post(f"{OLLAMA_URL}/api/generate", json=payload, timeout=120)
+            response.raise_for_status()
+    except Exception as e:
+        print(f"Error warming up {COMMAND_MODEL}: {e}")
+
+def chat(messages):
+    """
+    Sends a conversation (a list of {"role", "content"} dicts) to the chat
+    endpoint and returns the reply. The history goes over as structured
+    messages, so the model's own chat template is applied instead of a flat
+    "role: content" transcript being rebuilt on every turn.
+    """
+    with session_lock:
+        response = session.post(
+            f"{OLLAMA_URL}/api/chat",
+            json={"model": MODEL, "messages": messages, "stream": False, "keep_alive": KEEP_ALIVE},
+            timeout=120
+        )
+        response.raise_for_status()
+        return response.json()["message"]["content"].strip()
+
+def normalize_request(request):
+    """
+    Reduces a transcript to the words that matter for the cache key: case,
+    spacing and the punctuation Whisper adds around words ("Jeff, set 2000
+    RPM.") are dropped, while decimals like "1.5" are left intact.
+    """
+    words = (word.strip(string.punctuation) for word in request.lower().split())
+    return " ".join(word for word in words if word)
+
+def cache_key(base_prompt, request, options=None):
+    """
+    Key for a cached answer. The model and its options are part of it, so
+    answers from an earlier model or settings are not served after a change.
+    """
+    parts = [COMMAND_MODEL, json.dumps(options, sort_keys=True), base_prompt, normalize_request(request)]
+    return hashlib.sha256("\0".join(parts).encode()).hexdigest()
+
+def cached_generate(base_prompt, request, stop_when=None, options=None):
+    """
+    Returns the model's answer for base_prompt + request, reusing the answer from
+    disk when the same request (ignoring case, spacing and punctuation) was
+    asked recently of the same model with the same options. Users tend to
+    repeat the same few commands, so most lookups skip the model.
+    """
+    key = cache_key(base_prompt, request, options)
+
+    os.makedirs(os.path.dirname(CACHE_FILE), exist_ok=True)
+    with shelve.open(CACHE_FILE) as cache:
+        entry = cache.get(key)
+        if entry is not None and time.time() - entry[0] < CACHE_TTL:
+            print("Using cached model output.")
+            return entry[1]
+
+    output = generate(base_prompt + request, stop_when, options)
+    if output:
+        with shelve.open(CACHE_FILE) as cache:
+            cache[key] = (time.time(), output)
+            if len(cache) > CACHE_SIZE:
+                # Drop expired answers, then the oldest, to keep the file small.
+                # Each entry is read once, and trimming to below CACHE_SIZE means
+                # this only runs again after a batch of new answers.
+                now = time.time()
+                saved_at = {k: cache[k][0] for k in cache.keys()}
+                for old_key in [k for k, t in saved_at.items() if now - t >= CACHE_TTL]:
+                    del cache[old_key]
+                    del saved_at[old_key]
+                by_age = sorted(saved_at, key=saved_at.get)
+                for old_key in by_age[:len(by_age) - CACHE_TRIM_TO]:
+                    del cache[old_key]
+    return output
+
+def forget(base_prompt, request, options=None):
+    """
+    Drops the cached answer for a request, e.g. one the user rejected or
+    cancelled, so the same words are asked of the model again next time
+    instead of replaying the wrong answer.
+    """
+    try:
+        os.makedirs(os.path.dirname(CACHE_FILE), exist_ok=True)
+        with shelve.open(CACHE_FILE) as cache:
+            cache.pop(cache_key(base_prompt, request, options), None)
+    except Exception as e:
+        print(f"Error clearing cached model output: {e}")
@@ -1,78 +1,67 @@
 #!/usr/bin/env python3
-import serial
 import time
-import re
 import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.animation import FuncAnimation
 from matplotlib.widgets import TextBox, Button
 import voice_to_text as v2t  # Using your existing voice_to_text module (unchanged)
-import subprocess  # Needed to call phi4 and to play audio
-import asyncio
-import edge_tts  # Edge TTS package for neural voices
-import os
+from centrifuge_io import (  # Serial, telemetry and command parsing shared with interface.py
+    TelemetryBuffer, SerialReader, open_serial, downsample, autoscale_y,
+    parse_command, parse_spoken_command, answer_complete, skips_confirmation, is_affirmative
+)
+import llm  # Ollama model calls with an on-disk answer cache
+import text_to_speech as tts  # Edge TTS with cached audio
 import threading
 
-# ----- TTS Helper Function using Edgpipe TTS -----
-async def speak_text(text):
-    # Using "en-US-GuyNeural" for a deeper voice.
-    communicate = edge_tts.Communicate(text, voice="en-GB-RyanNeural")
-    output_file = "tts_output.mp3"
-    await communicate.save(output_file)
-    # On macOS, use afplay to play the audio file. Change if on another OS.
-    subprocess.run(["afplay", output_file])
-    os.remove(output_file)
+# ----- TTS Helper Function using Edge TTS -----
+VOICE = "en-GB-RyanNeural"  # A deeper voice than the default
+
+def speak(text, cache=True, wait=True):
+    tts.speak(text, voice=VOICE, cache=cache, wait=wait)
+
+# Fixed voice replies, synthesized and decoded ahead of time
+CONFIRM_QUESTION = "Is this correct? Please say yes or no."
+CONFIRMED_REPLY = "Command confirmed. Sending command."
+ABORTED_REPLY = "Command aborted."
+CANCELLED_REPLY = "Command cancelled. Stopping the motor."
+CHAT_GREETING = "Chat mode activated. What would you like to talk about?"
+CHAT_EXIT_REPLY = "Exiting chat mode."
+NEW_SESSION_QUESTION = "Do you want to start a new session? Please say yes or no."
+GOODBYE = "Exiting the program. Goodbye."
+FIXED_REPLIES = [
+    CONFIRM_QUESTION, CONFIRMED_REPLY, ABORTED_REPLY, CANCELLED_REPLY,
+    CHAT_GREETING, CHAT_EXIT_REPLY, NEW_SESSION_QUESTION, GOODBYE,
+]
+
+# ----- Model Command Prompt -----
+# Kept byte-identical across calls so Ollama reuses the cached prefix and only
+# processes the spoken request appended after it.
+COMMAND_PROMPT = (
+    "Extract the centrifuge settings from the following request exactly as stated. "
+    "Ignore any extraneous words that do not affect the numerical values. "
+    "Return your answer as plain text in the format: <RPM> <TIME>.\n\n"
+    "For example, if the input is \"set centrifuge to 2000 rpm for 15 seconds\", "
+    "the output should be: 2000 15\n\n"
+    "Request: "
+)
 
 # ----- Configuration -----
 SERIAL_PORT = "/dev/cu.usbmodem1101"  # Update this to your Arduino port
 BAUD_RATE = 9600  # Using the higher baud rate
+RESCALE_EVERY = 20  # Animation frames between axis refreshes (1 s at 50 ms)
+CANCEL_WINDOW = 3  # Seconds to say "cancel" after an unconfirmed voice command
+# Chat button background: the 'rainbow' colormap baked once to an RGBA byte
+# array, so imshow shows it as-is instead of colormapping it on every redraw.
+CHAT_GRADIENT = (plt.get_cmap("rainbow")(np.linspace(0, 1, 256)) * 255).astype(np.uint8).reshape(1, 256, 4)
 
 # ----- Global Variables -----
 countdown_end_time = None  # Global countdown timer for sending stop command
-# Variables for data storage; these will be reinitialized each session.
-t_data = []
-rpm_data = []
-ma_data = []
-set_data = []
-pwm_data = []
-perr_data = []
+# Rolling plot data; reinitialized each session.
+telemetry = None
 start_time = None
+voice_label = None  # New voice button label, applied on the GUI thread by update().
 
 # ----- Helper Functions -----
-def parse_command(command):
-    """
-    Parses a command string to extract the RPM and time.
-    Strips extra whitespace and expects a format like "<RPM> <TIME>" or "<RPM>,<TIME>".
-    It also supports natural language inputs containing "rpm" and a time unit.
-    """
-    command = command.strip()
-    # Try simple two-number format.
-    two_numbers = re.match(r"^(\d+)[,\s]+(\d+)$", command)
-    if two_numbers:
-        rpm_val = int(two_numbers.group(1))
-        timer = int(two_numbers.group(2))
-        return rpm_val, timer
-
-    # Otherwise, use regex search for natural language patterns.
-    rpm_match = re.search(r"(\d+)\s*rpm", command, re.IGNORECASE)
-    time_match = re.search(r"(\d+)\s*(minutes?|seconds?)", command, re.IGNORECASE)
-    
-    if rpm_match:
-        rpm_val = int(rpm_match.group(1))
-    else:
-        try:
-            rpm_val = int(float(command))
-        except ValueError:
-            rpm_val = None
-
-    timer = None
-    if time_match:
-        timer = int(time_match.group(1))
-        unit = time_match.group(2).lower()
-        if 'minute' in unit:
-            timer *= 60  # Convert minutes to seconds
-    return rpm_val, timer
-
 def send_command(command, ser):
     """
     Processes the command string (from voice or manual input),
@@ -85,7 +74,7 @@ def send_command(command, ser):
     if rpm is not None:
         if timer is not None:
             data = f"{rpm},{timer}\n"
-            countdown_end_time = time.time() + timer  # Set countdown end time
+            countdown_end_time = time.monotonic() + timer  # Set countdown end time
         else:
             data = f"{rpm}\n"
             countdown_end_time = None  # Clear countdown if no time provided
@@ -107,7 +96,7 @@ def manual_submit(event):
         timer_val = int(time_text) if time_text else None
         if timer_val is not None:
             command = f"{rpm_val},{timer_val}\n"
-            countdown_end_time = time.time() + timer_val
+            countdown_end_time = time.monotonic() + timer_val
         else:
             command = f"{rpm_val}\n"
             countdown_end_time = None
@@ -119,45 +108,69 @@ def manual_submit(event):
     except Exception as e:
         print(f"Error in manual submission: {e}")
 
+def send_with_cancel_window(command, command_text):
+    """
+    Sends a clearly parsed voice command right away instead of asking for a
+    yes/no first, then listens briefly so the user can still say "cancel".
+    A cancelled command's cached answer for command_text is dropped.
+    """
+    send_command(command, ser)
+    rpm, timer = parse_command(command)
+    # Different for every command, so it isn't kept in the speech cache
+    speak(f"Sending {rpm} RPM for {timer} seconds. Say cancel to abort.", cache=False)
+
+    # Short listening window for a cancel.
+    original_duration = v2t.DURATION
+    v2t.DURATION = CANCEL_WINDOW
+    response = v2t.recognize_speech()
+    v2t.DURATION = original_duration
+    if "cancel" in response.lower() or "abort" in response.lower():
+        print("User cancelled. Stopping the motor.")
+        send_command("0", ser)
+        speak(CANCELLED_REPLY, wait=False)
+        llm.forget(COMMAND_PROMPT, command_text, options=llm.COMMAND_OPTIONS)
+
 def voice_input_async():
     """
     Runs the voice input process in a separate thread so that the UI remains responsive.
     """
     # Update the voice button label to indicate listening.
-    voice_button.label.set_text("Listening...")
-    plt.draw()
+    global voice_label
+    voice_label = "Listening..."  # Drawn by update() on the GUI thread.
     
     print("Listening for voice command...")
     command_text = v2t.listen_for_trigger()  # Blocks until a valid voice command is captured
     if command_text:
         print("Voice command recognized:", command_text)
-        base_prompt = (
-            "Extract the centrifuge settings from the following request exactly as stated. "
-            "Ignore any extraneous words that do not affect the numerical values. "
-            "Return your answer as plain text in the format: <RPM> <TIME>.\n\n"
-            "For example, if the input is \"set centrifuge to 2000 rpm for 15 seconds\", "
-            "the output should be: 2000 15\n\n"
-            "Request: "
-        )
-        combined_prompt = base_prompt + command_text
-        print("Generated Prompt:", combined_prompt)
-        
-        try:
-            result = subprocess.run(
-                ['ollama', 'run', 'phi4', combined_prompt],
-                capture_output=True,
-                text=True
-            )
-            output = result.stdout.strip()
-            print("Raw output from phi4:", output)
-        except Exception as e:
-            print(f"Error running phi4: {e}")
-            output = ""
+        rpm, timer = parse_spoken_command(command_text)
+        if rpm is not None:
+            # A plain "<N> rpm for <N> seconds" request doesn't need the model.
+            output = f"{rpm} {timer}"
+            print("Parsed directly from speech:", output)
+        else:
+            combined_prompt = COMMAND_PROMPT + command_text
+            print("Generated Prompt:", combined_prompt)
+            # Get the fixed replies ready while the model works on the request.
+            tts.prefetch([CONFIRM_QUESTION, CONFIRMED_REPLY, ABORTED_REPLY], voice=VOICE)
+            
+            try:
+                output = llm.cached_generate(
+                    COMMAND_PROMPT, command_text, stop_when=answer_complete, options=llm.COMMAND_OPTIONS
+                )
+                print(f"Raw output from {llm.COMMAND_MODEL}:", output)
+            except Exception as e:
+                print(f"Error running {llm.COMMAND_MODEL}: {e}")
+                output = ""
         
-        if output:
-            confirmation_text = f"The parsed command is: {output}. Is this correct? Please say yes or no."
-            asyncio.run(speak_text(confirmation_text))
-            print(confirmation_text)
+        if output and skips_confirmation(command_text, output):
+            # A clean "<RPM> <TIME>" answer is sent without the yes/no round trip.
+            send_with_cancel_window(output, command_text)
+        elif output:
+            # Only the parsed command needs new speech; the question is cached.
+            confirmation_text = f"The parsed command is: {output}."
+            print(confirmation_text, CONFIRM_QUESTION)
+            speak(confirmation_text, cache=False)
+            speak(CONFIRM_QUESTION)
             
             # Temporarily change listening duration for confirmation.
             original_duration = v2t.DURATION
@@ -165,21 +178,21 @@ def voice_input_async():
             response = v2t.recognize_speech()
             v2t.DURATION = original_duration
             print("User response:", response)
-            if "yes" in response.lower():
+            if is_affirmative(response):
                 print("User confirmed. Sending command.")
-                asyncio.run(speak_text("Command confirmed. Sending command."))
+                speak(CONFIRMED_REPLY, wait=False)  # Plays while the command goes out
                 send_command(output, ser)
             else:
                 print("User did not confirm. Command aborted.")
-                asyncio.run(speak_text("Command aborted."))
+                speak(ABORTED_REPLY, wait=False)
+                llm.forget(COMMAND_PROMPT, command_text, options=llm.COMMAND_OPTIONS)
         else:
-            print("No valid output received from phi4.")
+            print(f"No valid output received from {llm.COMMAND_MODEL}.")
     else:
         print("No voice command detected.")
     
     # Revert the voice button label.
-    voice_button.label.set_text("Voice Input")
-    plt.draw()
+    voice_label = "Voice Input"
 
 def voice_input(event):
     # Run the voice input process in a separate thread to keep the UI responsive.
@@ -189,22 +202,11 @@ def voice_input(event):
 
 def call_chatbot_api(conversation_history):
     """
-    Converts the conversation history into a prompt and calls your chatbot model.
-    Adjust the command if you use a different API or model.
+    Sends the conversation history to your chatbot model's chat endpoint.
+    Adjust llm.py if you use a different API or model.
     """
-    prompt = ""
-    for msg in conversation_history:
-        # Format each message as "role: content"
-        prompt += f"{msg['role']}: {msg['content']}\n"
-    prompt += "assistant: "  # Prompt the assistant to respond
-    
     try:
-        result = subprocess.run(
-            ['ollama', 'run', 'phi4', prompt],
-            capture_output=True,
-            text=True
-        )
-        response = result.stdout.strip()
+        response = llm.chat(conversation_history)
     except Exception as e:
         print(f"Error calling chatbot API: {e}")
         response = "Sorry, I'm having trouble responding."
@@ -221,7 +223,7 @@ def chat_mode():
     ]
     
     # Announce that chat mode has been activated.
-    asyncio.run(speak_text("Chat mode activated. What would you like to talk about?"))
+    speak(CHAT_GREETING)
     
     while True:
         # Use voice-to-text to capture user input.
@@ -231,7 +233,7 @@ def chat_mode():
         
         # Allow exit from chat mode.
         if "exit chat" in user_input.lower() or "quit chat" in user_input.lower():
-            asyncio.run(speak_text("Exiting chat mode."))
+            speak(CHAT_EXIT_REPLY, wait=False)
             break
         
         # Append the user input to the conversation history.
@@ -242,36 +244,28 @@ def chat_mode():
         conversation_history.append({"role": "assistant", "content": response})
         
         # Speak the AI's response using TTS.
-        asyncio.run(speak_text(response))
+        speak(response, cache=False)
 
 
 
 
 def run_session():
     """Run one full RPM session with plotting and input handling."""
-    global ser, countdown_end_time, t_data, rpm_data, ma_data, set_data, pwm_data, perr_data, start_time
+    global ser, countdown_end_time, telemetry, start_time
     countdown_end_time = None
-    t_data = []
-    rpm_data = []
-    ma_data = []
-    set_data = []
-    pwm_data = []
-    perr_data = []
-    start_time = time.time()
+    telemetry = TelemetryBuffer()
+    start_time = time.monotonic()
 
     # Open the serial port
     try:
-        ser = serial.Serial(SERIAL_PORT, BAUD_RATE, timeout=0.1)
+        ser = open_serial(SERIAL_PORT, BAUD_RATE)
     except Exception as e:
         print(f"Error opening serial port: {e}")
         return
 
     time.sleep(2)  # Allow time for the connection to initialize
-
-    # Regular expression to match data lines from the serial port.
-    pattern = re.compile(
-        r"RPM:\s*([-\d.]+)\s+MA:\s*([-\d.]+)\s+Set:\s*([-\d.]+)\s+PWM:\s*([-\d]+)\s+%Err:\s*([-\d.]+)"
-    )
+    reader = SerialReader(ser)  # Reads and timestamps samples on its own thread
+    reader.start()
 
     # Set up the figure and subplots.
     fig, (ax1, ax2, ax3) = plt.subplots(3, 1, figsize=(10, 8))
@@ -299,61 +293,36 @@ def run_session():
     ax3.legend()
     ax3.grid(True)
 
-    def update(frame):
-        global countdown_end_time
-        # Read available serial lines.
-        while ser.in_waiting:
-            try:
-                line = ser.readline().decode("utf-8", errors="ignore").strip()
-            except Exception as e:
-                print(f"Error reading line from serial: {e}")
-                continue
-            if line:
-                m = pattern.search(line)
-                if m:
-                    try:
-                        rpm_val = float(m.group(1))
-                        ma_val = float(m.group(2))
-                        set_val = float(m.group(3))
-                        pwm_val = int(m.group(4))
-                        perr_val = float(m.group(5))
-                    except ValueError:
-                        continue
-                    current_time = time.time() - start_time
-                    t_data.append(current_time)
-                    rpm_data.append(rpm_val)
-                    ma_data.append(ma_val)
-                    set_data.append(set_val)
-                    pwm_data.append(pwm_val)
-                    perr_data.append(perr_val)
+    # Lines are blitted by FuncAnimation; axes and the countdown (a figure
+    # text, which cannot be blitted) are refreshed with a full redraw.
+    lines = (line_rpm, line_ma, line_set, line_pwm, line_perr)
+    for line in lines:
+        line.set_animated(True)
 
-        # Keep only the last 60 seconds of data.
-        current_time = time.time() - start_time
-        while t_data and t_data[0] < current_time - 60:
-            t_data.pop(0)
-            rpm_data.pop(0)
-            ma_data.pop(0)
-            set_data.pop(0)
-            pwm_data.pop(0)
-            perr_data.pop(0)
+    rescale_data = False  # Samples arrived since the y-limits were last fitted.
 
-        # Update plot lines.
-        line_rpm.set_data(t_data, rpm_data)
-        line_ma.set_data(t_data, ma_data)
-        line_set.set_data(t_data, set_data)
-        line_pwm.set_data(t_data, pwm_data)
-        line_perr.set_data(t_data, perr_data)
-
-        for ax in (ax1, ax2, ax3):
-            ax.set_xlim(max(0, current_time - 60), current_time + 1)
-            ax.relim()
-            ax.autoscale_view(scalex=False)
-
-        # Update countdown text if a timer is active.
+    def update(frame):
+        global countdown_end_time, voice_label
+        nonlocal rescale_data
+        # Apply a label left by the voice thread, repainting just the button.
+        if voice_label is not None:
+            voice_button.label.set_text(voice_label)
+            voice_label = None
+            voice_button.ax.draw_artist(voice_button.ax.patch)
+            voice_button.ax.draw_artist(voice_button.label)
+            fig.canvas.blit(voice_button.ax.bbox)
+
+        # Collect the samples the reader thread has queued since the last frame.
+        blocks = reader.drain()
+        for stamp, samples in blocks:
+            telemetry.append(stamp - start_time, samples)
+        rescale_data = rescale_data or bool(blocks)
+
+        # Work out the countdown text, stopping the motor once it runs out.
+        countdown = ""
         if countdown_end_time is not None:
-            remaining = countdown_end_time - time.time()
+            remaining = countdown_end_time - time.monotonic()
             if remaining <= 0:
-                countdown_text.set_text("")
                 try:
                     ser.write("0\n".encode())
                     ser.flush()
@@ -361,12 +330,40 @@ def run_session():
                     print(f"Error sending stop command: {e}")
                 countdown_end_time = None
             else:
-                countdown_text.set_text(f"Remaining Time: {int(remaining)} s")
-        else:
-            countdown_text.set_text("")
-        return line_rpm, line_ma, line_set, line_pwm, line_perr
+                countdown = f"Remaining Time: {int(remaining)} s"
+
+        # Nothing to repaint unless samples arrived or the axes/countdown are due.
+        rescale = frame % RESCALE_EVERY == 0
+        redraw = rescale or countdown != countdown_text.get_text()
+        if not (blocks or redraw):
+            return ()
 
-    ani = FuncAnimation(fig, update, interval=100)
+        # Keep only the last 60 seconds of data.
+        current_time = time.monotonic() - start_time
+        telemetry.trim(current_time - 60)
+
+        # Update plot lines.
+        t, rpm, ma, set_rpm, pwm, perr = telemetry.view()
+        line_rpm.set_data(*downsample(t, rpm))
+        line_ma.set_data(*downsample(t, ma))
+        line_set.set_data(*downsample(t, set_rpm))
+        line_pwm.set_data(*downsample(t, pwm))
+        line_perr.set_data(*downsample(t, perr))
+
+        if redraw:
+            if rescale:
+                for ax in (ax1, ax2, ax3):
+                    ax.set_xlim(max(0, current_time - 60), current_time + 1)
+                # The y-limits can only move when new samples came in.
+                if rescale_data:
+                    rescale_data = False
+                    for ax, rows in ((ax1, (rpm, ma, set_rpm)), (ax2, (pwm,)), (ax3, (perr,))):
+                        autoscale_y(ax, rows)
+            countdown_text.set_text(countdown)
+            fig.canvas.draw()
+        return lines
+
+    ani = FuncAnimation(fig, update, interval=50, blit=True, cache_frame_data=False)
 
     # Set up widgets.
     ax_rpm = plt.axes([0.1, 0.22, 0.3, 0.075])
@@ -389,12 +386,8 @@ def run_session():
     # Create the Chat Mode button axes
     ax_chat = plt.axes([0.1, 0.1, 0.15, 0.075])
 
-    # Create a rainbow gradient background in the button's axes.
-    n = 256  # resolution
-    # Create a horizontal gradient array.
-    gradient = np.linspace(0, 1, n).reshape(1, n)
-    # Display the gradient with the 'rainbow' colormap.
-    ax_chat.imshow(gradient, aspect='auto', cmap='rainbow', origin='lower', extent=[0, 1, 0, 1])
+    # Display the pre-rendered rainbow gradient in the button's axes.
+    ax_chat.imshow(CHAT_GRADIENT, aspect='auto', origin='lower', extent=[0, 1, 0, 1])
     # Make the axes background transparent so the gradient shows.
     ax_chat.patch.set_alpha(0)
 
@@ -407,19 +400,24 @@ def run_session():
 
 
     plt.show()
+    reader.stop()
     ser.close()
 
 if __name__ == '__main__':
+    # Have every fixed reply ready, and the command and Whisper models loaded, before they are first needed
+    tts.prefetch(FIXED_REPLIES, voice=VOICE)
+    threading.Thread(target=llm.warm_up, args=(COMMAND_PROMPT,), daemon=True).start()
+    threading.Thread(target=v2t.warm_up, daemon=True).start()
     while True:
         run_session()  # Run one full RPM session.
 
         # After the session ends (when the plot window is closed), ask if the user wants a new session.
-        asyncio.run(speak_text("Do you want to start a new session? Please say yes or no."))
+        speak(NEW_SESSION_QUESTION)
         print("Awaiting response for new session...")
         response = v2t.recognize_speech()
         print("Response received:", response)
-        if "yes" in response.lower():
+        if is_affirmative(response):
             continue
         else:
-            asyncio.run(speak_text("Exiting the program. Goodbye."))
+            speak(GOODBYE)
             break
\ No newline at end of file
@@ -345,89 +345,65 @@
 #!/usr/bin/env python3
 import serial
 import time
-import re
+import threading
 import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.animation import FuncAnimation
 from matplotlib.widgets import TextBox, Button
 import voice_to_text as v2t  # Using your existing voice_to_text module (unchanged)
-import subprocess  # Needed to call phi4 and to play audio
-import asyncio
-import edge_tts  # Edge TTS package for neural voices
-import os
-
-# ----- TTS Helper Function using Edge TTS -----
-async def speak_text(text):
-    # Using "en-US-GuyNeural" for a deeper, Obama-like voice.
-    communicate = edge_tts.Communicate(text, voice="en-US-GuyNeural")
-    output_file = "tts_output.mp3"
-    await communicate.save(output_file)
-    # On macOS, use afplay to play the audio file. Change if on another OS.
-    subprocess.run(["afplay", output_file])
-    os.remove(output_file)
+from text_to_speech import speak, prefetch  # Edge TTS on one shared event loop, with cached audio
+from centrifuge_io import (  # Ring buffer, y-limit fitting, telemetry and command parsing
+    TelemetryBuffer, autoscale_y, parse_chunk, answer_complete, parse_command, parse_spoken_command,
+    is_affirmative
+)
+import llm  # Command model through the running Ollama server
+
+# ----- TTS Fixed Replies -----
+# Synthesized and decoded in the background now, so they play without a
+# network round trip when a command is confirmed or aborted.
+CONFIRMED_REPLY = "Command confirmed. Sending command."
+ABORTED_REPLY = "Command aborted."
+prefetch([CONFIRMED_REPLY, ABORTED_REPLY])
+
+# ----- Model Command Prompt -----
+# Kept byte-identical across calls so Ollama reuses the cached prefix and only
+# processes the spoken request appended after it.
+COMMAND_PROMPT = (
+    "Extract the centrifuge settings from the following request exactly as stated. "
+    "Ignore any extraneous words (such as names or filler words) that do not affect the numerical values. "
+    "Do the following:\n\n"
+    "1. Find the integer immediately preceding the term \"rpm\" (case insensitive) and use that as the RPM value without altering it.\n"
+    "2. Identify the time duration mentioned. If the duration is specified in minutes, convert it to seconds; if in seconds, use it as is.\n"
+    "3. Return your answer as plain text in the exact format: <RPM> <TIME>, with no extra formatting or characters.\n\n"
+    "For example, if the input is \"set centrifuge to 2000 rpm for 15 seconds\", the output should be: 2000 15\n\n"
+    "Request: "
+)
 
 # ----- Configuration -----
 SERIAL_PORT = "/dev/cu.usbmodem1101"  # Update this to your Arduino port
 BAUD_RATE = 9600  # Using the higher baud rate
+RESCALE_EVERY = 10  # Animation frames between axis/countdown redraws (1 s at 100 ms)
 
 # Open the serial port with a short timeout (non-blocking read)
 ser = serial.Serial(SERIAL_PORT, BAUD_RATE, timeout=0.1)
+# Load the command and Whisper models in the background while the Arduino resets
+threading.Thread(target=llm.warm_up, args=(COMMAND_PROMPT,), daemon=True).start()
+threading.Thread(target=v2t.warm_up, daemon=True).start()
 time.sleep(2)  # Allow time for the connection to initialize
 
 # ----- Global Variables for Countdown -----
 countdown_end_time = None  # Stores the end time for the running timer (if any)
 
 # ----- Data Storage -----
-t_data = []
-rpm_data = []
-ma_data = []
-set_data = []
-pwm_data = []
-perr_data = []
-start_time = time.time()
-
-# Regular expression to match lines like:
-# "RPM: 123.45   MA: 123.45   Set: 1500.00   PWM: 200   %Err: 20.50"
-pattern = re.compile(
-    r"RPM:\s*([-\d.]+)\s+MA:\s*([-\d.]+)\s+Set:\s*([-\d.]+)\s+PWM:\s*([-\d]+)\s+%Err:\s*([-\d.]+)"
-)
+# One preallocated float32 ring buffer for time and all five channels, so
+# samples are written in place instead of being boxed into Python lists
+telemetry = TelemetryBuffer()
+start_time = time.monotonic()
 
-# ----- Helper Function: Parse Command (used for voice input) -----
-def parse_command(command):
-    """
-    Parses a command string to extract the RPM and time.
-    First, it checks if the command consists of two numbers (expected from phi4),
-    allowing either a comma or whitespace separator.
-    Otherwise, it searches for a pattern with "rpm" and time units.
-    """
-    # Check for a simple two-number format: "<RPM> <TIME>" or "<RPM>,<TIME>"
-    two_numbers = re.match(r"^\s*(\d+)[,\s]+(\d+)\s*$", command)
-    if two_numbers:
-        rpm_val = int(two_numbers.group(1))
-        timer = int(two_numbers.group(2))
-        return rpm_val, timer
-
-    # Otherwise, parse natural language commands
-    rpm_match = re.search(r"(\d+)\s*rpm", command, re.IGNORECASE)
-    time_match = re.search(r"(\d+)\s*(minutes?|seconds?)", command, re.IGNORECASE)
-    
-    if rpm_match:
-        rpm_val = int(rpm_match.group(1))
-    else:
-        # Fallback: try interpreting the entire command as a number
-        try:
-            rpm_val = int(float(command.strip()))
-        except ValueError:
-            rpm_val = None
-
-    timer = None
-    if time_match:
-        timer = int(time_match.group(1))
-        unit = time_match.group(2).lower()
-        if 'minute' in unit:
-            timer = timer * 60  # Convert minutes to seconds
-    return rpm_val, timer
+# Partial serial line left over from the last read, completed by the next one
+serial_tail = b""
 
+# ----- Helper Function: Send Command (parse_command is shared via centrifuge_io) -----
 def send_command(command):
     """
     Processes the command string (from voice input),
@@ -441,7 +417,7 @@ def send_command(command):
         # Format the data: if a timer is provided, send as "rpm,timer"
         if timer is not None:
             data = f"{rpm},{timer}\n"
-            countdown_end_time = time.time() + timer  # Set countdown end time
+            countdown_end_time = time.monotonic() + timer  # Set countdown end time
         else:
             data = f"{rpm}\n"
             countdown_end_time = None  # Clear countdown if no time provided
@@ -460,7 +436,7 @@ def manual_submit(event):
         timer_val = int(time_text) if time_text else None
         if timer_val is not None:
             command = f"{rpm_val},{timer_val}\n"
-            countdown_end_time = time.time() + timer_val  # Set countdown end time
+            countdown_end_time = time.monotonic() + timer_val  # Set countdown end time
         else:
             command = f"{rpm_val}\n"
             countdown_end_time = None
@@ -479,33 +455,29 @@ def voice_input(event):
     command_text = v2t.listen_for_trigger()  # Blocks until a valid voice command is captured
     if command_text:
         print("Voice command recognized:", command_text)
-        # Build the prompt for phi4
-        base_prompt = (
-            "Extract the centrifuge settings from the following request exactly as stated. "
-            "Ignore any extraneous words (such as names or filler words) that do not affect the numerical values. "
-            "Do the following:\n\n"
-            "1. Find the integer immediately preceding the term \"rpm\" (case insensitive) and use that as the RPM value without altering it.\n"
-            "2. Identify the time duration mentioned. If the duration is specified in minutes, convert it to seconds; if in seconds, use it as is.\n"
-            "3. Return your answer as plain text in the exact format: <RPM> <TIME>, with no extra formatting or characters.\n\n"
-            "For example, if the input is \"set centrifuge to 2000 rpm for 15 seconds\", the output should be: 2000 15\n\n"
-            "Request: "
-        )
-        combined_prompt = base_prompt + command_text
-        print("Generated Prompt:", combined_prompt)
+        # Unambiguous "<N> rpm for <N> seconds" requests are parsed directly;
+        # the model is only needed for the rest
+        rpm_val, timer_val = parse_spoken_command(command_text)
+        if rpm_val is not None:
+            output = f"{rpm_val} {timer_val}"
+            print("Parsed directly from speech:", output)
+        else:
+            # Build the prompt for the model
+            combined_prompt = COMMAND_PROMPT + command_text
+            print("Generated Prompt:", combined_prompt)
         
-        # Call phi4 via subprocess to get the formatted command
-        result = subprocess.run(
-            ['ollama', 'run', 'phi4', combined_prompt],
-            capture_output=True,
-            text=True
-        )
-
-        output = result.stdout.strip()
-        print("Raw output from phi4:", output)
+            # Ask the model through the Ollama server, which keeps the model loaded between commands;
+            # the answer is streamed and cut off as soon as it holds "<RPM> <TIME>"
+            try:
+                output = llm.generate(combined_prompt, stop_when=answer_complete, options=llm.COMMAND_OPTIONS)
+            except Exception as e:
+                print(f"Error running {llm.COMMAND_MODEL}: {e}")
+                output = ""
+            print(f"Raw output from {llm.COMMAND_MODEL}:", output)
         
         # Use Edge TTS to ask for confirmation of the parsed command
         confirmation_text = f"The parsed command is: {output}. Is this correct? Please say yes or no."
-        asyncio.run(speak_text(confirmation_text))
+        speak(confirmation_text, cache=False)
         print(confirmation_text)
         
         # Listen for user's confirmation response with a 5-second listening window
@@ -514,13 +486,13 @@ def voice_input(event):
         response = v2t.recognize_speech()
         v2t.DURATION = original_duration  # Restore the original duration
         print("User response:", response)
-        if "yes" in response.lower():
+        if is_affirmative(response):
             print("User confirmed. Sending command.")
-            asyncio.run(speak_text("Command confirmed. Sending command."))
+            speak(CONFIRMED_REPLY, wait=False)  # Plays while the command goes out
             send_command(output)
         else:
             print("User did not confirm. Command aborted.")
-            asyncio.run(speak_text("Command aborted."))
+            speak(ABORTED_REPLY, wait=False)
     else:
         print("No voice command detected.")
     
@@ -559,68 +531,57 @@ ax3.set_title("Percentage Error vs. Time")
 ax3.legend()
 ax3.grid(True)
 
+# Lines are blitted each frame; everything else is only drawn on full redraws
+for line in (line_rpm, line_ma, line_set, line_pwm, line_perr):
+    line.set_animated(True)
+
 def update(frame):
-    global countdown_end_time
-    # Read all available serial lines
-    while ser.in_waiting:
-        line = ser.readline().decode("utf-8", errors="ignore").strip()
-        if line:
-            m = pattern.search(line)
-            if m:
-                try:
-                    rpm_val = float(m.group(1))
-                    ma_val = float(m.group(2))
-                    set_val = float(m.group(3))
-                    pwm_val = int(m.group(4))
-                    perr_val = float(m.group(5))
-                except ValueError:
-                    continue
-                current_time = time.time() - start_time
-                t_data.append(current_time)
-                rpm_data.append(rpm_val)
-                ma_data.append(ma_val)
-                set_data.append(set_val)
-                pwm_data.append(pwm_val)
-                perr_data.append(perr_val)
+    global countdown_end_time, serial_tail
+    # Read everything waiting in one call and parse all complete lines at once,
+    # lines like "RPM: 123.45   MA: 123.45   Set: 1500.00   PWM: 200   %Err: 20.50"
+    samples, serial_tail = parse_chunk(ser.read(ser.in_waiting), serial_tail)
+
+    # Store this frame's samples in one write
+    current_time = time.monotonic() - start_time
+    if len(samples):
+        telemetry.append(current_time, samples)
 
     # Keep only the last 60 seconds of data
-    current_time = time.time() - start_time
-    while t_data and t_data[0] < current_time - 60:
-        t_data.pop(0)
-        rpm_data.pop(0)
-        ma_data.pop(0)
-        set_data.pop(0)
-        pwm_data.pop(0)
-        perr_data.pop(0)
+    telemetry.trim(current_time - 60)
 
     # Update the plot lines
-    line_rpm.set_data(t_data, rpm_data)
-    line_ma.set_data(t_data, ma_data)
-    line_set.set_data(t_data, set_data)
-    line_pwm.set_data(t_data, pwm_data)
-    line_perr.set_data(t_data, perr_data)
-
-    # Adjust x-axis to display only the last 60 seconds
-    for ax in (ax1, ax2, ax3):
-        ax.set_xlim(max(0, current_time - 60), current_time + 1)
-        ax.relim()
-        ax.autoscale_view(scalex=False)
-
-    # Update countdown text if a timer is active
+    t, rpm, ma, set_rpm, pwm, perr = telemetry.view()
+    line_rpm.set_data(t, rpm)
+    line_ma.set_data(t, ma)
+    line_set.set_data(t, set_rpm)
+    line_pwm.set_data(t, pwm)
+    line_perr.set_data(t, perr)
+
+    # Work out the countdown text if a timer is active
+    countdown = ""
     if countdown_end_time is not None:
-        remaining = countdown_end_time - time.time()
+        remaining = countdown_end_time - time.monotonic()
         if remaining <= 0:
-            countdown_text.set_text("")  # Timer expired
-            ser.write("0\n".encode())    # Send stop command to the Arduino
+            ser.write("0\n".encode())    # Timer expired: send stop command to the Arduino
             countdown_end_time = None
         else:
-            countdown_text.set_text(f"Remaining Time: {int(remaining)} s")
-    else:
-        countdown_text.set_text("")
+            countdown = f"Remaining Time: {int(remaining)} s"
+
+    # Blitting only repaints the lines, so the axes and the countdown are
+    # refreshed with a full redraw every RESCALE_EVERY frames or when the
+    # countdown text changes
+    if frame % RESCALE_EVERY == 0 or countdown != countdown_text.get_text():
+        # Adjust x-axis to display only the last 60 seconds; the y-limits are fitted
+        # with one numpy min/max per channel instead of relim() walking every line
+        for ax, rows in ((ax1, (rpm, ma, set_rpm)), (ax2, (pwm,)), (ax3, (perr,))):
+            ax.set_xlim(max(0, current_time - 60), current_time + 1)
+            autoscale_y(ax, rows)
+        countdown_text.set_text(countdown)
+        fig.canvas.draw()
 
     return line_rpm, line_ma, line_set, line_pwm, line_perr
 
-ani = FuncAnimation(fig, update, interval=100)
+ani = FuncAnimation(fig, update, interval=100, blit=True, cache_frame_data=False)
 
 # ----- Set Up Widgets -----
 # Manual input: Two TextBoxes and a Submit Button
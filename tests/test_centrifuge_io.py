@@ -0,0 +1,35 @@
+import pytest
+
+pytest.importorskip("serial")  # centrifuge_io opens the Arduino port with pyserial
+
+from centrifuge_io import parse_spoken_command, skips_confirmation
+
+@pytest.mark.parametrize("transcript, answer, expected", [
+    ("jeff set 2000 rpm for 15 seconds", "2000 15", True),
+    ("jeff, set 2,000 rpm for 2 minutes.", "2000 120", True),
+    ("jeff two thousand rpm for fifteen seconds", "2000 15", True),
+    ("jeff stop at 0 rpm for 10 seconds", "0 10", False),          # "stop" is a correction word
+    ("jeff 0 rpm for 10 seconds", "0 10", True),
+    ("don't set 3000 rpm for 10 seconds", "3000 10", False),       # negation
+    ("set 3000 rpm, actually 2000 rpm for 10 seconds", "2000 10", False),
+    ("jeff 9000 rpm for 5 minutes", "9000 300", False),            # above the firmware's range
+    ("jeff 2000 rpm for an hour", "2000 3600", False),             # too long without a yes/no
+    ("jeff two thousand rpm for fifteen seconds", "15 2000", False),  # swapped answer
+    ("jeff 2000 rpm for 15 seconds", "15 2000", False),            # answer contradicts the transcript
+    ("jeff.", "2000 15", False),                                   # prompt example echoed back
+    ("jeff 2000 rpm for 15 seconds", "2000 15 seconds", False),    # not a plain answer
+    ("jeff 2000 rpm for 0 seconds", "2000 0", False),
+])
+def test_skips_confirmation(transcript, answer, expected):
+    assert skips_confirmation(transcript, answer) is expected
+
+@pytest.mark.parametrize("transcript, expected", [
+    ("set 2,000 rpm for 15 seconds", (2000, 15)),
+    ("jeff set 1,500 rpm for 30 seconds", (1500, 30)),
+    ("jeff set 2000 rpm for 2 minutes", (2000, 120)),
+    ("2000 rpm for 1.5 minutes", (None, None)),
+    ("1 minute 30 seconds", (None, None)),
+    ("jeff two thousand rpm please", (None, None)),
+])
+def test_parse_spoken_command(transcript, expected):
+    assert parse_spoken_command(transcript) == expected
@@ -0,0 +1,177 @@
+import io
+import os
+import re
+import uuid
+import atexit
+import asyncio
+import hashlib
+import functools
+import threading
+import edge_tts
+import sounddevice as sd
+import soundfile as sf
+
+# Settings
+VOICE = "en-US-GuyNeural"
+CACHE_DIR = os.path.expanduser("~/.cache/centrifuge_tts")
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+# --- Audio Output ---
+# One output stream is opened on first use and kept open, so each phrase is
+# written straight to the device instead of launching a player process.
+stream = None
+stream_lock = threading.Lock()
+
+def get_stream(samplerate, channels):
+    """Returns the shared output stream, reopening it only if the format changes."""
+    global stream
+    if stream is None or stream.samplerate != samplerate or stream.channels != channels:
+        if stream is not None:
+            stream.close()
+        stream = sd.OutputStream(samplerate=samplerate, channels=channels, dtype="float32")
+        stream.start()
+    return stream
+
+# --- Event Loop ---
+# Synthesis runs on one long-lived event loop in a background thread, so each
+# phrase is submitted to it instead of creating and closing a loop per call.
+loop = asyncio.new_event_loop()
+threading.Thread(target=loop.run_forever, daemon=True).start()
+# Phrases are spoken one at a time, in the order they were requested, even
+# when the caller did not wait for the previous one to finish
+speech_lock = asyncio.Lock()
+
+@atexit.register
+def close_stream():
+    """Closes the shared output stream on exit so the device is released cleanly."""
+    global stream
+    with stream_lock:
+        if stream is not None:
+            stream.close()
+            stream = None
+
+def decode_audio(source):
+    """Decodes an audio file or file-like object to (frames, channels) float32 samples and a sample rate."""
+    return sf.read(source, dtype="float32", always_2d=True)
+
+@functools.lru_cache(maxsize=64)
+def load_cached_audio(path):
+    """Decodes a cached mp3 once; fixed prompts are replayed from memory afterwards."""
+    return decode_audio(path)
+
+def play_samples(samples, samplerate):
+    """Plays decoded audio on the shared output stream and returns when it has been written."""
+    with stream_lock:
+        get_stream(samplerate, samples.shape[1]).write(samples)
+
+# --- Synthesis ---
+# Saves in progress on the loop, by cache file, so a speak() of text that
+# prefetch() is still saving waits for that save instead of starting another
+saving = {}
+
+async def save_speech(text, voice, output_file):
+    """Synthesizes text with Edge TTS into output_file."""
+    # Write to a temporary name first so an interrupted save is never reused;
+    # the name is unique so no other save (even in another process) shares it
+    partial_file = f"{output_file}.{uuid.uuid4().hex}.part"
+    try:
+        await edge_tts.Communicate(text, voice=voice).save(partial_file)
+        os.replace(partial_file, output_file)
+    finally:
+        if os.path.exists(partial_file):
+            os.remove(partial_file)
+
+async def synthesize(text, voice=VOICE):
+    """
+    Returns the path of the cached mp3 for text, synthesizing it with Edge TTS
+    first if it is not on disk yet. Files in CACHE_DIR are keyed by voice and
+    text, so fixed prompts and repeated confirmations are only synthesized once.
+    """
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    key = hashlib.md5(f"{voice}\n{text}".encode()).hexdigest()
+    output_file = os.path.join(CACHE_DIR, key + ".mp3")
+
+    if not os.path.exists(output_file):
+        task = saving.get(output_file)
+        if task is None:
+            task = asyncio.ensure_future(save_speech(text, voice, output_file))
+            saving[output_file] = task
+            task.add_done_callback(lambda _: saving.pop(output_file, None))
+        # Shielded so one caller giving up doesn't cancel the save for the others
+        await asyncio.shield(task)
+    return output_file
+
+async def fetch_audio(text, voice=VOICE):
+    """Synthesizes text in memory, without touching the disk, and returns the decoded audio."""
+    audio = bytearray()
+    async for chunk in edge_tts.Communicate(text, voice=voice).stream():
+        if chunk["type"] == "audio":
+            audio += chunk["data"]
+    return decode_audio(io.BytesIO(bytes(audio)))
+
+def prefetch(texts, voice=VOICE):
+    """
+    Synthesizes and decodes texts on the shared loop without playing them,
+    so prompts that will be needed shortly play with no network or decode
+    delay, while other slow work (like waiting on the model) is still running.
+    """
+    async def synthesize_all():
+        unique = dict.fromkeys(texts)
+        results = await asyncio.gather(*(synthesize(text, voice) for text in unique), return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                print(f"Error prefetching speech: {result}")
+                continue
+            try:
+                load_cached_audio(result)
+            except Exception as e:
+                print(f"Error decoding speech: {e}")
+
+    return asyncio.run_coroutine_threadsafe(synthesize_all(), loop)
+
+async def speak_text(text, voice=VOICE, cache=True):
+    """
+    Speaks text aloud with Edge TTS, playing straight from the cache when the
+    same text was spoken before.
+
+    Pass cache=False for one-off text like chat replies: the audio then stays
+    in memory, and the reply is synthesized sentence by sentence so the first
+    sentence starts playing while the rest are still being fetched.
+    """
+    async with speech_lock:
+        if cache:
+            output_file = await synthesize(text, voice)
+            try:
+                await asyncio.to_thread(play_samples, *load_cached_audio(output_file))
+            except Exception as e:
+                print(f"Error playing audio: {e}")
+            return
+
+        sentences = [s for s in SENTENCE_END.split(text.strip()) if s]
+        tasks = [asyncio.create_task(fetch_audio(s, voice)) for s in sentences]
+        for task in tasks:
+            try:
+                samples, samplerate = await task
+                # Play on a worker thread so the remaining fetches keep running
+                await asyncio.to_thread(play_samples, samples, samplerate)
+            except Exception as e:
+                print(f"Error playing audio: {e}")
+
+def report_error(future):
+    """Prints why a phrase spoken with wait=False failed, since no caller sees its result."""
+    if not future.cancelled() and future.exception() is not None:
+        print(f"Error speaking: {future.exception()}")
+
+def speak(text, voice=VOICE, cache=True, wait=True):
+    """
+    Speaks text on the shared loop and blocks until playback has been written.
+
+    With wait=False it returns straight away, so the caller can carry on (e.g.
+    send the command) while the reply plays; only use it when nothing that
+    follows needs the speech to be over, like listening on the microphone.
+    """
+    future = asyncio.run_coroutine_threadsafe(speak_text(text, voice, cache), loop)
+    if wait:
+        future.result()
+    else:
+        future.add_done_callback(report_error)
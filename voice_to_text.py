@@ -1,65 +1,263 @@
 import os
-import string
+import re
+import time
+import logging
+import queue
+import bisect
+import threading
+import contextlib
+import collections
 import sounddevice as sd
 import numpy as np
-import whisper
-import scipy.io.wavfile as wav
-import time
+import webrtcvad
+from scipy.signal import resample_poly
 
 # Settings
 SAMPLE_RATE = 48000  # Updated to 48kHz
 DURATION = 8       # Seconds to record per chunk
-FILENAME = "input.wav"
+WHISPER_RATE = 16000  # Sample rate Whisper transcribes at
 TRIGGER_WORD = "Jeff"  # Trigger word (case-insensitive)
+MODEL = "small"     # Whisper model for commands and replies
+TRIGGER_MODEL = "tiny.en"  # Faster model that only has to spot the trigger word
+VAD_FRAME = SAMPLE_RATE * 30 // 1000  # 30 ms frames, a length webrtcvad accepts
+VAD_MODE = 3        # webrtcvad aggressiveness, 0-3; 3 rejects the most non-speech
+END_SILENCE = 17    # Non-speech frames (~0.5 s) that end an utterance
+PRE_ROLL = 10       # Frames (~0.3 s) kept from before speech starts, so the first word isn't clipped
+MAX_UTTERANCE = 15  # Seconds before a long utterance is cut off and transcribed anyway
+MAX_BATCH = 4       # Backlogged utterances joined into one transcription
+FOLLOW_UP_WORDS = 3  # Words after the trigger below which the command is taken to follow after a pause
+FOLLOW_UP_TIMEOUT = 5  # Seconds to wait for that command to start before giving up on it
+
+# Options for every transcription. Commands are always English, so language
+# detection is skipped; greedy decoding at a single temperature is plenty for
+# short commands (no re-decoding at higher temperatures when a segment looks
+# unsure), each 30 s window is decoded on its own without the previous one's
+# text as a prompt, and the VAD filter drops the silence that makes up most of
+# each recording before it is decoded.
+TRANSCRIBE_OPTIONS = dict(
+    language="en", beam_size=1, temperature=0,
+    condition_on_previous_text=False, vad_filter=True
+)
+
+# Let CTranslate2's OpenMP threads sleep between transcriptions instead of
+# spinning on every core while the app waits for speech; read when the
+# runtime first loads, so it is set before faster_whisper is imported
+os.environ.setdefault("OMP_WAIT_POLICY", "PASSIVE")
 
-# Load the Whisper model on CPU with FP32 explicitly
-model = whisper.load_model("small").to("cpu").float()
+# Per-utterance progress goes to a logger rather than print: every snippet of
+# speech is transcribed while listening, and callers print the text they use.
+# Set V2T_LOG_LEVEL=INFO to see it; an unknown level falls back to WARNING
+# rather than stopping the app from importing this module.
+LOG_LEVEL = logging.getLevelName(os.environ.get("V2T_LOG_LEVEL", "WARNING").upper())
+if not isinstance(LOG_LEVEL, int):
+    LOG_LEVEL = logging.WARNING
+logging.basicConfig(level=LOG_LEVEL)
+log = logging.getLogger(__name__)
+
+# Loaded Whisper models by size; the lock makes a transcription that starts
+# while warm_up() is still loading a model wait for it instead of loading a
+# second copy
+models = {}
+models_lock = threading.Lock()
+
+def get_model(size=MODEL):
+    """
+    Loads a Whisper model through faster-whisper (CTranslate2) with int8
+    weights on CPU, which runs its matmuls on int8 kernels and needs about
+    half the memory of the FP32 PyTorch model. Each size is loaded on first
+    use so importing this module (and starting the GUI) stays fast.
+    """
+    model = models.get(size)
+    if model is None:
+        with models_lock:
+            model = models.get(size)
+            if model is None:
+                from faster_whisper import WhisperModel
+                model = WhisperModel(size, device="cpu", compute_type="int8", cpu_threads=os.cpu_count())
+                models[size] = model
+    return model
+
+def warm_up():
+    """
+    Loads both Whisper models and runs a second of silence through each, so
+    the first utterance doesn't also pay for reading the weights and for the
+    first run of every CTranslate2 kernel. The VAD filter is off, as it
+    would drop the silence before the model ever saw it.
+    """
+    silence = np.zeros(WHISPER_RATE, dtype=np.float32)
+    for model in (TRIGGER_MODEL, MODEL):
+        try:
+            segments, _ = get_model(model).transcribe(silence, language="en", beam_size=1)
+            for _ in segments:  # Decoding is lazy; read the segments to run it
+                pass
+        except Exception as e:
+            print(f"Error warming up Whisper {model}: {e}")
+
+def whisper_audio(recording):
+    """Converts mono 48 kHz int16 audio to the float32 16 kHz array Whisper takes."""
+    # Convert int16 audio to float32 normalized to [-1, 1]; one ufunc pass casts
+    # and scales together, with no intermediate float copy
+    recording_float = np.multiply(recording, 1 / 32768, dtype=np.float32)
+
+    # Downsample to Whisper's 16 kHz here, so the array can be passed straight
+    # to the model instead of going through a WAV file and being decoded again
+    return resample_poly(recording_float, WHISPER_RATE, SAMPLE_RATE).astype(np.float32, copy=False)
+
+def transcribe(recording, model=MODEL):
+    """Transcribes mono 48 kHz int16 audio with the given Whisper model and returns the text in lowercase."""
+    audio = whisper_audio(recording)
+    log.info("Transcribing...")
+
+    # Transcribe the audio using Whisper; segments are decoded as they are read
+    segments, _ = get_model(model).transcribe(audio, **TRANSCRIBE_OPTIONS)
+    recognized_text = "".join(segment.text for segment in segments)
+    log.info("Recognized Speech: %s", recognized_text)
+    return recognized_text.lower()
+
+def transcribe_utterances(batch, model=TRIGGER_MODEL):
+    """
+    Transcribes a batch of utterances from utterances() in one Whisper call and
+    returns one lowercase text per utterance. With more than one, the clip is
+    decoded with word timestamps and each word goes to the utterance its
+    midpoint falls in, so the batch shares one encoder pass but the words of
+    one utterance are never mistaken for another's.
+    """
+    if len(batch) == 1:
+        return [transcribe(batch[0], model)]
+
+    audio = whisper_audio(np.concatenate(batch))
+    log.info("Transcribing %d utterances...", len(batch))
+    segments, _ = get_model(model).transcribe(audio, word_timestamps=True, **TRANSCRIBE_OPTIONS)
+
+    # Where each utterance ends in the joined clip, in seconds
+    ends = list(np.cumsum([len(utterance) for utterance in batch]) / SAMPLE_RATE)
+    texts = [""] * len(batch)
+    for segment in segments:
+        for word in segment.words:
+            index = min(bisect.bisect(ends, (word.start + word.end) / 2), len(batch) - 1)
+            texts[index] += word.word
+    for text in texts:
+        log.info("Recognized Speech: %s", text)
+    return [text.lower() for text in texts]
+
+# Reused by every recognize_speech() call instead of a new ~0.75 MB array each
+# time; grown if a caller raises DURATION past its size
+recording_buffer = np.empty((DURATION * SAMPLE_RATE, 1), dtype=np.int16)
 
 def recognize_speech():
+    """Records for a fixed DURATION and returns the transcribed text in lowercase."""
+    global recording_buffer
+    frames = int(DURATION * SAMPLE_RATE)
+    if len(recording_buffer) < frames:
+        recording_buffer = np.empty((frames, 1), dtype=np.int16)
     print("Recording...")
-    # Record audio for a fixed duration
-    recording = sd.rec(int(DURATION * SAMPLE_RATE), samplerate=SAMPLE_RATE, channels=1, dtype=np.int16)
+    # The sample count, channels and dtype all come from the buffer slice
+    recording = sd.rec(out=recording_buffer[:frames], samplerate=SAMPLE_RATE)
     sd.wait()
+    return transcribe(recording[:, 0])
 
-    # Convert int16 audio to float32 normalized to [-1, 1]
-    recording_float = recording.astype(np.float32).squeeze() / 32768.0
+def utterances():
+    """
+    Listens continuously and yields utterances as lists of mono 48 kHz int16
+    arrays as soon as the speaker pauses. The input stream's callback keeps
+    queueing 30 ms frames while an utterance is being transcribed, so no speech
+    is missed between recordings, and webrtcvad keeps silence away from Whisper.
+
+    Usually each list holds one utterance. If the speaker kept talking while the
+    last one was transcribed, the utterances already waiting in the queue (up to
+    MAX_BATCH) are yielded together so they can share one Whisper call instead
+    of each paying for a full encoder pass.
 
-    # Convert the audio back to int16
-    recording_int16 = (recording_float * 32768).astype(np.int16)
+    While nobody is speaking, an empty list is yielded for every live frame,
+    so a caller waiting for speech can give up after a timeout.
+    """
+    vad = webrtcvad.Vad(VAD_MODE)
+    frames = queue.Queue()
 
-    # Save the recording to a WAV file
-    wav.write(FILENAME, SAMPLE_RATE, recording_int16)
-    print("Transcribing...")
+    def callback(indata, frame_count, time_info, status):
+        frames.put(bytes(indata))
 
-    # Transcribe the audio using Whisper
-    result = model.transcribe(FILENAME)
-    recognized_text = result.get('text', '')
-    print(f"Recognized Speech: {recognized_text}")
+    with sd.RawInputStream(samplerate=SAMPLE_RATE, channels=1, dtype="int16",
+                           blocksize=VAD_FRAME, callback=callback):
+        before = collections.deque(maxlen=PRE_ROLL)
+        speech = []
+        silence = 0
+        batch = []
+        while True:
+            frame = frames.get()
+            if vad.is_speech(frame, SAMPLE_RATE):
+                if not speech:
+                    speech.extend(before)
+                speech.append(frame)
+                silence = 0
+            elif speech:
+                speech.append(frame)
+                silence += 1
+            else:
+                before.append(frame)
 
-    # Delete the temporary WAV file
-    os.remove(FILENAME)
-    return recognized_text.lower()
+            if speech and (silence >= END_SILENCE or len(speech) * VAD_FRAME >= MAX_UTTERANCE * SAMPLE_RATE):
+                batch.append(np.frombuffer(b"".join(speech), dtype=np.int16))
+                speech = []
+                silence = 0
+                before.clear()
+
+            # Finished utterances are only held back while more queued audio is
+            # waiting to be checked, and never past the live end of the stream
+            if batch and (len(batch) >= MAX_BATCH or frames.empty()):
+                yield batch
+                batch = []
+            elif not speech and not batch and frames.empty():
+                yield []
 
 def listen_for_trigger(trigger_word=TRIGGER_WORD):
     """
     Continuously listens and returns the transcribed sentence as soon as the first 20 words contain the trigger word.
-    Punctuation is stripped from each word for accurate matching.
+    The word is matched as a whole word with one compiled regex, so punctuation next to it doesn't matter.
+    Speech is scanned with the fast TRIGGER_MODEL; only the audio that contained the trigger
+    is transcribed again with MODEL, so the command itself keeps the larger model's accuracy.
+    When the trigger is followed by fewer than FOLLOW_UP_WORDS words ("Jeff, ... set 2000 rpm"),
+    the next utterance is taken as the rest of the command if it starts within FOLLOW_UP_TIMEOUT.
     """
     print(f"Listening for the trigger word '{trigger_word}' (case-insensitive) in the first 20 words...")
-    trigger_word = trigger_word.lower()  # Ensure trigger word is lowercase for comparison
-    while True:
-        text = recognize_speech().strip()
-        # Remove punctuation from each word
-        words = [word.strip(string.punctuation) for word in text.split()]
-        # Check if the trigger word is found in the first 20 words
-        if any(word == trigger_word for word in words[:20]):
-            print("Trigger phrase detected!")
-            # Return the full detected sentence for further processing in your pipeline
-            return text
-        else:
-            print("No trigger phrase detected.")
-        # Short pause before the next recording cycle
-        time.sleep(1)
+    trigger_pattern = re.compile(rf"\b{re.escape(trigger_word)}\b", re.IGNORECASE)
+    # Each utterance is transcribed as soon as the speaker pauses; the stream
+    # is closed again once the trigger has been heard
+    with contextlib.closing(utterances()) as stream:
+        command = None  # Utterances from the trigger onward, while waiting for the rest
+        deadline = None
+        for batch in stream:
+            if command is not None:
+                # The command follows the trigger after a pause: take the next
+                # utterance with it, or go with what was heard once time is up
+                if batch or time.monotonic() > deadline:
+                    command += batch
+                    break
+                continue
+            if not batch:
+                continue
+
+            # Backlogged utterances are transcribed in one call, but each one
+            # is checked on its own
+            for index, text in enumerate(transcribe_utterances(batch)):
+                # Check if the trigger word is found in the first 20 words; the text is
+                # searched as is, and only the words before a match are counted
+                match = trigger_pattern.search(text)
+                if match and len(text[:match.start()].split()) < 20:
+                    print("Trigger phrase detected!")
+                    # Speech from before the trigger is left out of the command
+                    command = batch[index:]
+                    deadline = time.monotonic() + FOLLOW_UP_TIMEOUT
+                    break
+            else:
+                log.info("No trigger phrase detected.")
+                continue
+            if len(command) > 1 or len(re.findall(r"\w+", text[match.end():])) >= FOLLOW_UP_WORDS:
+                break
+            print("Waiting for the rest of the command...")
+
+    # Return the full detected sentence for further processing in your pipeline
+    return transcribe(np.concatenate(command)).strip()
 
 if __name__ == '__main__':
     detected_sentence = listen_for_trigger()